@@ -5,7 +5,16 @@ from core.etl import etl
 
 def main(args):
 
-    etl.run(dry_run=args.dry_run)
+    if args.advise_compression:
+        etl.advise(apply=args.apply_encodings)
+        return
+
+    etl.run(
+        dry_run=args.dry_run,
+        incremental=args.incremental,
+        resume=args.resume,
+        export=args.export,
+    )
 
 
 if __name__ == '__main__':
@@ -21,6 +30,28 @@ if __name__ == '__main__':
         --live (flag): From the terminal, start the application with this flag
         to retain the the AWS infrastructure on completion.
         Example: python app.py --live
+
+        --incremental (flag): From the terminal, start the application with
+        this flag to load only the log data which arrived since the last run.
+        Example: python app.py --live --incremental
+
+        --resume (flag): From the terminal, start the application with this
+        flag to resume the last run if it failed; stages which completed with
+        the same inputs are skipped.
+        Example: python app.py --live --resume
+
+        --export (flag): From the terminal, start the application with this
+        flag to export the dimensional model to S3 as Parquet files.
+        Example: python app.py --live --export
+
+        --advise_compression (flag): From the terminal, start the application
+        with this flag to compare the encodings of the dimensional model with
+        those recommended by ANALYZE COMPRESSION on the running cluster.
+        Example: python app.py --advise_compression
+
+        --apply_encodings (flag): Use with --advise_compression to rebuild
+        the tables with the recommended encodings through a deep copy.
+        Example: python app.py --advise_compression --apply_encodings
     """
 
     parser = argparse.ArgumentParser()
@@ -37,7 +68,44 @@ if __name__ == '__main__':
         action='store_false',
         help='Retain AWS infrastructure after ETL operation.',
     )
-    parser.set_defaults(dry_run=True)
+    parser.add_argument(
+        '--incremental',
+        dest='incremental',
+        action='store_true',
+        help='Load only log data which arrived since the last run.',
+    )
+    parser.add_argument(
+        '--resume',
+        dest='resume',
+        action='store_true',
+        help='Skip stages which completed in the last, failed run.',
+    )
+    parser.add_argument(
+        '--export',
+        dest='export',
+        action='store_true',
+        help='Export the dimensional model to S3 as Parquet files.',
+    )
+    parser.add_argument(
+        '--advise_compression',
+        dest='advise_compression',
+        action='store_true',
+        help='Compare table encodings with ANALYZE COMPRESSION.',
+    )
+    parser.add_argument(
+        '--apply_encodings',
+        dest='apply_encodings',
+        action='store_true',
+        help='Rebuild tables with the recommended encodings.',
+    )
+    parser.set_defaults(
+        dry_run=True,
+        incremental=False,
+        resume=False,
+        export=False,
+        advise_compression=False,
+        apply_encodings=False,
+    )
 
     args = parser.parse_args()
 
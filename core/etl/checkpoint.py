@@ -0,0 +1,344 @@
+import datetime
+import hashlib
+import inspect
+import json
+import os
+import threading
+import uuid
+
+from core.etl.scheduler import task_name
+from core.logger import (
+    log,
+    metrics,
+)
+
+logger = log.setup_custom_logger(__name__)
+
+
+def fingerprint(*inputs):
+    """
+    Return a short hash of the inputs of a pipeline stage. Callables, such as
+    the parametrised SQL query functions of a manifest, are hashed by their
+    source code, so that changing a query invalidates the stages using it.
+
+    Args:
+        inputs: Manifests, tasks or any other values the stage depends on.
+
+    Returns:
+        string
+    """
+    def normalise(value):
+        if callable(value):
+            try:
+                return inspect.getsource(value)
+            except (OSError, TypeError):
+                return repr(value)
+        if isinstance(value, dict):
+            return {str(k): normalise(v) for k, v in sorted(value.items())}
+        if isinstance(value, (list, tuple, set)):
+            return [normalise(x) for x in value]
+        return repr(value)
+
+    payload = json.dumps(normalise(inputs), sort_keys=True)
+
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def task_key(stage, task):
+    """
+    Return the key under which a manifest task is checkpointed. COPY tasks
+    are keyed by their S3 path as well, since incremental runs load several
+    partitions into the same table.
+
+    Args:
+        stage (string): Name of the stage the task belongs to.
+
+        task (dict): A manifest task.
+
+    Returns:
+        string
+    """
+    if 'bucket' in task:
+        return f"{stage}:{task_name(task)}:{task['bucket']}"
+
+    return f'{stage}:{task_name(task)}'
+
+
+class RunState:
+
+    def __init__(self, path, resume=False):
+
+        self.path = path
+        self.lock = threading.Lock()
+        self.sql = None
+        self.state = None
+
+        if resume:
+            self.state = self.load()
+
+            if self.state is None:
+                logger.info('No run state found, starting a new run')
+            elif self.state.get('completed_at'):
+                logger.info(
+                    f"Run '{self.state['run_id']}' already completed, "
+                    f"starting a new run"
+                )
+                self.state = None
+            else:
+                logger.info(f"Resuming run '{self.state['run_id']}'")
+
+        if self.state is None:
+            self.state = {
+                'run_id': datetime.datetime.utcnow().strftime(
+                    '%Y%m%dT%H%M%S'
+                ) + '-' + uuid.uuid4().hex[:8],
+                'started_at': datetime.datetime.utcnow().isoformat(),
+                'completed_at': None,
+                'stages': {},
+            }
+            self.save()
+
+    @property
+    def run_id(self):
+
+        return self.state['run_id']
+
+    @property
+    def stages(self):
+
+        return self.state['stages']
+
+    def load(self):
+        """
+        Load the run state of the previous run from the local state file.
+
+        Returns:
+            dict
+        """
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self):
+        """
+        Write the run state to the local state file. The file is replaced
+        atomically so that a crash never leaves a half-written state behind.
+
+        Returns:
+            None
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def attach(self, sql):
+        """
+        Mirror the run state to the control table in the data warehouse. The
+        stages which completed before the database connection was available
+        are written to the table straight away.
+
+        Args:
+            sql (PostgreSQLOperator): A connected PostgreSQLOperator.
+
+        Returns:
+            None
+        """
+        self.sql = sql
+        self.sql.create_run_state_table()
+
+        for key, record in self.stages.items():
+            self.record(key=key, record=record)
+
+    def record(self, key, record):
+
+        if self.sql is None:
+            return
+
+        self.sql.record_run_state(
+            run_id=self.run_id,
+            stage=key,
+            fingerprint=record['fingerprint'],
+        )
+
+    def is_complete(self, key, inputs_hash):
+        """
+        Return True if a stage or task has completed with the same inputs.
+
+        Args:
+            key (string): Name of the stage or task.
+
+            inputs_hash (string): Fingerprint of the current inputs.
+
+        Returns:
+            bool
+        """
+        record = self.stages.get(key)
+
+        return record is not None and record['fingerprint'] == inputs_hash
+
+    def invalidate(self, key):
+        """
+        Forget a stage and every stage which completed after it, so that they
+        are executed again. Tasks belonging to the same stage are kept.
+
+        Args:
+            key (string): Name of the stage.
+
+        Returns:
+            None
+        """
+        prefix = key.split(':')[0]
+        keys = list(self.stages)
+        positions = [
+            i for i, x in enumerate(keys) if x.split(':')[0] == prefix
+        ]
+
+        if not positions:
+            return
+
+        with self.lock:
+            for x in keys[positions[0]:]:
+                if x == key or x.split(':')[0] != prefix:
+                    del self.stages[x]
+            self.save()
+
+    def complete(self, key, inputs_hash, outputs=None):
+        """
+        Record that a stage or task has completed.
+
+        Args:
+            key (string): Name of the stage or task.
+
+            inputs_hash (string): Fingerprint of the inputs it ran with.
+
+            outputs (dict): Values produced by the stage which later stages
+            need when it is skipped on resume.
+
+        Returns:
+            None
+        """
+        record = {
+            'fingerprint': inputs_hash,
+            'completed_at': datetime.datetime.utcnow().isoformat(),
+            'outputs': outputs or {},
+        }
+
+        with self.lock:
+            self.stages[key] = record
+            self.save()
+            self.record(key=key, record=record)
+
+    def run_stage(self, stage, inputs, func):
+        """
+        Execute a pipeline stage unless it has already completed with the same
+        inputs. The dictionary returned by `func` is stored with the stage and
+        returned on resume in place of executing the stage again. The stage
+        runs in a metrics span named after it.
+
+        Args:
+            stage (string): Name of the stage.
+
+            inputs (tuple): Values the stage depends on.
+
+            func (callable): Function which executes the stage.
+
+        Returns:
+            dict
+        """
+        inputs_hash = fingerprint(inputs)
+
+        if self.is_complete(stage, inputs_hash):
+            logger.info(f"Stage '{stage}' already completed, skipping")
+            return self.stages[stage]['outputs']
+
+        self.invalidate(stage)
+
+        with metrics.span(stage):
+            outputs = func() or {}
+
+        self.complete(stage, inputs_hash, outputs)
+
+        logger.info(f"Stage '{stage}' completed")
+
+        return outputs
+
+    def pending(self, stage, manifest):
+        """
+        Return the tasks of a manifest which have not completed with their
+        current inputs. If any task is pending, the stages which completed
+        after this stage are invalidated. Explicit dependencies on completed
+        tasks are removed, as those tasks are not scheduled again.
+
+        Args:
+            stage (string): Name of the stage executing the manifest.
+
+            manifest (list): A list of task dictionaries.
+
+        Returns:
+            list
+        """
+        completed = set()
+        tasks = []
+
+        for task in manifest:
+            if self.is_complete(task_key(stage, task), fingerprint(task)):
+                completed.add(task_name(task))
+            else:
+                tasks.append(task)
+
+        if completed:
+            logger.info(
+                f"Stage '{stage}': {len(completed)} tasks already completed, "
+                f"{len(tasks)} pending"
+            )
+
+        if tasks:
+            self.invalidate(task_key(stage, tasks[0]))
+
+        for i, task in enumerate(tasks):
+            depends_on = task.get('depends_on')
+            if depends_on:
+                if isinstance(depends_on, str):
+                    depends_on = (depends_on,)
+                tasks[i] = dict(
+                    task,
+                    depends_on=[x for x in depends_on if x not in completed],
+                )
+
+        return tasks
+
+    def complete_task(self, stage, task):
+        """
+        Record that a manifest task has completed. This method is passed as a
+        callback to the PostgreSQLOperator and may be invoked from worker
+        threads.
+
+        Args:
+            stage (string): Name of the stage executing the manifest.
+
+            task (dict): The completed manifest task.
+
+        Returns:
+            None
+        """
+        self.complete(task_key(stage, task), fingerprint(task))
+
+    def finish(self):
+        """
+        Mark the run as completed, a completed run is never resumed.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.state['completed_at'] = datetime.datetime.utcnow().isoformat()
+            self.save()
+
+        logger.info(f"Run '{self.run_id}' completed")
@@ -0,0 +1,177 @@
+import os
+import re
+
+from psycopg2 import sql as psql
+
+from core.logger import log
+
+logger = log.setup_custom_logger(__name__)
+
+# a column definition which declares its encoding
+COLUMN_ENCODING = re.compile(
+    r'^(?P<head>\s*(?P<column>\w+)\s+[^\n]*?\bENCODE\s+)(?P<encoding>\w+)',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def declared_encodings(ddl):
+    """
+    Return the encoding declared for each column of a CREATE TABLE
+    statement.
+
+    Args:
+        ddl (string): The rendered CREATE TABLE statement.
+
+    Returns:
+        dict: Column name mapped to its encoding.
+    """
+    return {
+        match['column']: match['encoding'].upper()
+        for match in COLUMN_ENCODING.finditer(ddl)
+    }
+
+
+def revise_ddl(ddl, encodings):
+    """
+    Replace the encodings declared in a CREATE TABLE statement.
+
+    Args:
+        ddl (string): The rendered CREATE TABLE statement.
+
+        encodings (dict): Column name mapped to its new encoding. Columns
+        which are not listed keep their encoding.
+
+    Returns:
+        string
+    """
+    def replace(match):
+        encoding = encodings.get(match['column'], match['encoding'])
+        return f"{match['head']}{encoding}"
+
+    return COLUMN_ENCODING.sub(replace, ddl)
+
+
+def compare_encodings(declared, recommended, blocks):
+    """
+    Compare the declared encodings of a table with those recommended by
+    ANALYZE COMPRESSION. The storage saved by each change is estimated from
+    the blocks the column stores and the reduction reported for it; the
+    same fraction of blocks is no longer read by scans of the column.
+
+    Args:
+        declared (dict): Column name mapped to its declared encoding.
+
+        recommended (dict): Column name mapped to a tuple of the recommended
+        encoding and the estimated reduction in percent.
+
+        blocks (dict): Column name mapped to its number of 1 MB blocks.
+
+    Returns:
+        list: A dictionary for each column whose encoding should change.
+    """
+    changes = []
+
+    for column, encoding in declared.items():
+        if column not in recommended:
+            continue
+
+        advised, reduction = recommended[column]
+
+        if advised == encoding or reduction <= 0:
+            continue
+
+        changes.append({
+            'column': column,
+            'declared': encoding,
+            'recommended': advised,
+            'reduction_pct': reduction,
+            'saved_mb': round(blocks.get(column, 0) * reduction / 100, 1),
+        })
+
+    return changes
+
+
+def advise_compression(sql, manifest, output_path=None, apply=False):
+    """
+    Run ANALYZE COMPRESSION on each table of a create_tables manifest and
+    compare the recommended encodings with those declared by its DDL
+    builder. The estimated savings are logged for each table. Revised DDL
+    is written to `output_path` and, if `apply` is True, each table is
+    rebuilt with it through a deep copy, except tables with an identity
+    column, whose values a deep copy would renumber.
+
+    Args:
+        sql (PostgreSQLOperator): An operator connected to the cluster.
+
+        manifest (list): The create_tables tasks of the tables to analyze.
+
+        output_path (string): Optional file to write the revised DDL to.
+
+        apply (bool): Set to True to rebuild the tables with the revised
+        encodings.
+
+    Returns:
+        dict: Table name mapped to the list of encoding changes.
+    """
+    advice = {}
+    revised = []
+
+    for task in manifest:
+        schema, table = task['vault'], task['table']
+        ddl = sql.render(task['query'](**task))
+        blocks = sql.get_column_blocks(schema=schema, table=table)
+        changes = compare_encodings(
+            declared=declared_encodings(ddl),
+            recommended=sql.get_compression(schema=schema, table=table),
+            blocks=blocks,
+        )
+        advice[f'{schema}.{table}'] = changes
+
+        if not changes:
+            logger.info(f"'{schema}.{table}' encodings are up to date")
+            continue
+
+        saved = sum(x['saved_mb'] for x in changes)
+        scanned = sum(blocks.values()) or 1
+
+        for change in changes:
+            logger.info(
+                f"  {schema}.{table}.{change['column']}: "
+                f"{change['declared']} -> {change['recommended']} "
+                f"({change['reduction_pct']}% smaller, "
+                f"{change['saved_mb']} MB)"
+            )
+
+        logger.info(
+            f"'{schema}.{table}' could save {round(saved, 1)} MB, "
+            f"{round(100 * saved / scanned, 1)}% of the blocks read by a "
+            f"full scan"
+        )
+
+        ddl = revise_ddl(
+            ddl=ddl,
+            encodings={x['column']: x['recommended'] for x in changes},
+        )
+        revised.append(ddl.strip())
+
+        if apply and sql.has_identity(schema=schema, table=table):
+            logger.warning(
+                f"'{schema}.{table}' has an identity column, which a deep "
+                f"copy would renumber, so it is not rebuilt; copy its revised "
+                f"DDL into its builder instead"
+            )
+        elif apply:
+            sql.deep_copy(
+                schema=schema,
+                table=table,
+                create_query=lambda vault, ddl=ddl: psql.SQL(ddl),
+            )
+
+    if output_path and revised:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with open(output_path, 'w') as f:
+            f.write('\n\n'.join(revised) + '\n')
+
+        logger.info(f'Revised DDL written to {output_path}')
+
+    return advice
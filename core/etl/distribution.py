@@ -0,0 +1,234 @@
+import json
+import os
+
+from core.logger import log
+from core.manifests.table_layouts import star_schema
+from settings.envs import (
+    DWH_DIST_ALL_MAX_ROWS,
+    DWH_INTERLEAVED_MIN_ROWS,
+)
+
+logger = log.setup_custom_logger(__name__)
+
+
+def plan_layouts(row_counts, schema=star_schema,
+                 all_max_rows=DWH_DIST_ALL_MAX_ROWS,
+                 interleaved_min_rows=DWH_INTERLEAVED_MIN_ROWS):
+    """
+    Choose the distribution and sort keys of the tables of a star schema
+    from their row counts. Dimensions small enough to be copied to every
+    node are distributed ALL, so joins to them never move data. The fact
+    table is distributed on the join column of the largest remaining
+    dimension, which is distributed on the same column so that their join
+    is co-located; any other large dimension is left to DISTSTYLE AUTO.
+
+    Tables are sorted on the columns they are filtered on or, for
+    dimensions, on their join column. An interleaved sort key is chosen for
+    large tables filtered on several columns with equal weight, otherwise
+    the sort key is compound.
+
+    Args:
+        row_counts (dict): Table name mapped to its number of rows.
+
+        schema (dict): The fact table, the join column of each dimension and
+        the filter columns of each table.
+
+        all_max_rows (int): Largest dimension which is distributed ALL.
+
+        interleaved_min_rows (int): Smallest table given an interleaved sort
+        key.
+
+    Returns:
+        dict: Table name mapped to the keyword arguments of its DDL builder.
+    """
+    fact, joins = schema['fact'], schema['joins']
+    large = sorted(
+        [x for x in joins if row_counts.get(x, 0) > all_max_rows],
+        key=lambda x: row_counts[x],
+        reverse=True,
+    )
+    layouts = {}
+
+    for dim, column in joins.items():
+        if dim not in large:
+            layouts[dim] = {'diststyle': 'ALL', 'distkey': None}
+        elif dim == large[0]:
+            layouts[dim] = {'diststyle': 'KEY', 'distkey': column}
+        else:
+            layouts[dim] = {'diststyle': 'AUTO', 'distkey': None}
+
+    if large:
+        layouts[fact] = {'diststyle': 'KEY', 'distkey': joins[large[0]]}
+    else:
+        layouts[fact] = {'diststyle': 'AUTO', 'distkey': None}
+
+    for table, layout in layouts.items():
+        sortkey = schema['filters'].get(table) or (joins.get(table),)
+        interleaved = (
+            len(sortkey) > 1
+            and row_counts.get(table, 0) >= interleaved_min_rows
+        )
+        layout['sortkey'] = list(sortkey)
+        layout['sortstyle'] = 'INTERLEAVED' if interleaved else 'COMPOUND'
+
+    return layouts
+
+
+def layout_changed(info, layout):
+    """
+    Return True if a table's distribution style or first sort key column, as
+    reported by svv_table_info, differ from a planned layout.
+
+    Args:
+        info (dict): The table's diststyle and sortkey1 values.
+
+        layout (dict): The planned layout of the table.
+
+    Returns:
+        bool
+    """
+    if layout['diststyle'] == 'KEY':
+        distributed = info['diststyle'] == f"KEY({layout['distkey']})"
+    else:
+        distributed = info['diststyle'].startswith(layout['diststyle'])
+
+    if layout['sortstyle'] == 'INTERLEAVED':
+        sorted_on = 'INTERLEAVED'
+    else:
+        sorted_on = layout['sortkey'][0]
+
+    return not distributed or info['sortkey1'] != sorted_on
+
+
+def load_layouts(path):
+    """
+    Load the table layouts saved by the last run of the planner.
+
+    Args:
+        path (string): Path of the table layout file.
+
+    Returns:
+        dict
+    """
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_layouts(path, layouts):
+    """
+    Save the planned table layouts, so that tables are created with them by
+    later full loads.
+
+    Args:
+        path (string): Path of the table layout file.
+
+        layouts (dict): Table name mapped to its layout.
+
+    Returns:
+        None
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    with open(path, 'w') as f:
+        json.dump(layouts, f, indent=2, sort_keys=True)
+
+
+def apply_layouts(manifest, layouts):
+    """
+    Return a copy of a create_tables manifest in which each task carries the
+    layout planned for its table.
+
+    Args:
+        manifest (list): The create_tables manifest.
+
+        layouts (dict): Table name mapped to its layout.
+
+    Returns:
+        list
+    """
+    return [dict(task, **layouts.get(task['table'], {})) for task in manifest]
+
+
+def rebuild_layouts(sql, manifest, schema_name, path):
+    """
+    Plan the layouts of the star schema from the row counts after a load and
+    rebuild, through a deep copy, each table whose layout has changed. The
+    layouts are saved to `path`.
+
+    A deep copy would renumber an identity column, such as the songplay_id
+    of fact_songplays, so tables with one are altered in place instead.
+    Interleaved sort keys cannot be altered, so a table with an identity
+    column which is, or would be, sorted that way keeps its layout until
+    the next full load creates it from the saved layouts.
+
+    Args:
+        sql (PostgreSQLOperator): An operator connected to the cluster.
+
+        manifest (list): The create_tables manifest.
+
+        schema_name (string): The vault holding the star schema.
+
+        path (string): Path of the table layout file.
+
+    Returns:
+        dict: The names of the tables which were rebuilt.
+    """
+    info = {
+        x['table']: x for x in sql.get_table_info()
+        if x['schema'] == schema_name
+    }
+    layouts = plan_layouts(
+        row_counts={table: x['tbl_rows'] for table, x in info.items()}
+    )
+    rebuilt = []
+
+    for task in apply_layouts(manifest, layouts):
+        table = task['table']
+
+        if task['vault'] != schema_name or table not in layouts:
+            continue
+
+        if table not in info:
+            continue
+
+        if not layout_changed(info=info[table], layout=layouts[table]):
+            continue
+
+        logger.info(
+            f"'{schema_name}.{table}' layout changed from "
+            f"{info[table]['diststyle']}, sorted on "
+            f"{info[table]['sortkey1']}, to {layouts[table]}"
+        )
+        if not sql.has_identity(schema=schema_name, table=table):
+            sql.deep_copy(
+                schema=schema_name,
+                table=table,
+                create_query=lambda vault, task=task: task['query'](
+                    **dict(task, vault=vault)
+                ),
+            )
+        elif 'INTERLEAVED' in (
+            layouts[table]['sortstyle'],
+            info[table]['sortkey1'],
+        ):
+            logger.warning(
+                f"'{schema_name}.{table}' has an identity column and an "
+                f"interleaved sort key, which cannot be altered in place; "
+                f"its layout is applied by the next full load"
+            )
+            continue
+        else:
+            sql.alter_layout(
+                schema=schema_name,
+                table=table,
+                layout=layouts[table],
+            )
+        rebuilt.append(table)
+
+    save_layouts(path=path, layouts=layouts)
+    logger.info(f'{len(rebuilt)} tables rebuilt with new layouts')
+
+    return {'rebuilt': rebuilt}
@@ -1,18 +1,99 @@
-from core.logger import log
-from core.manifests.copy_data import copy_data
+import os
+
+from core.etl.checkpoint import (
+    RunState,
+    fingerprint,
+)
+from core.etl.compression import advise_compression
+from core.etl.distribution import (
+    apply_layouts,
+    load_layouts,
+    rebuild_layouts,
+)
+from core.etl.maintenance import plan_maintenance
+from core.etl.plans import PlanCapture
+from core.etl.stats import QueryStats
+from core.logger import (
+    log,
+    metrics,
+)
+from core.manifests.copy_data import (
+    copy_data,
+    copy_log_manifest,
+    copy_log_partitions,
+    copy_staged_data,
+)
 from core.manifests.create_tables import create_tables
-from core.manifests.data_modelling import transform_data
+from core.manifests.data_modelling import (
+    incremental_data,
+    transform_data,
+)
+from core.manifests.export_data import export_data
+from core.manifests.raw_schemas import raw_schemas
 from core.operators.iam import IAMOperator
 from core.operators.postgres import PostgreSQLOperator
 from core.operators.redshift import RedshiftOperator
+from core.operators.s3 import S3Operator
+from core.operators.staging import StagingOperator
 from core.queries.sql import (
     create_schema,
 )
+from settings.envs import (
+    DWH_COMPRESSION_DDL_PATH,
+    DWH_COPY_PARALLELISM,
+    DWH_DB_PUBLIC_VAULT,
+    DWH_DB_RAW_VAULT,
+    DWH_MAX_CONCURRENCY,
+    DWH_PLAN_CAPTURE,
+    DWH_RUN_STATE_PATH,
+    DWH_STAGING_FORMAT,
+    DWH_TABLE_LAYOUT_PATH,
+    S3_EXPORT_DATAPATH,
+    S3_LOG_DATAPATH,
+    S3_MANIFEST_DATAPATH,
+    S3_SONG_DATAPATH,
+    S3_STAGING_DATAPATH,
+)
 
 logger = log.setup_custom_logger(__name__)
 
+LOG_SOURCE = 'raw__log_data'
+SONG_SOURCE = 'raw__song_data'
+
+
+def write_log_manifest(s3, state, partitions):
+    """
+    Write a COPY manifest which lists the log partitions pinned by the run,
+    so that a single COPY loads exactly the objects the watermark is taken
+    from. Objects which arrive after the partitions were listed are left
+    for the next run.
+
+    Args:
+        s3 (S3Operator): An S3 operator.
+
+        state (RunState): The run state.
+
+        partitions (list): S3 paths of the log partitions to load.
+
+    Returns:
+        string: S3 path of the COPY manifest file.
+    """
+    return state.run_stage(
+        stage='write_log_manifest',
+        inputs=(partitions, S3_MANIFEST_DATAPATH),
+        func=lambda: {
+            'path': s3.write_manifest(
+                entries=[{'url': x, 'mandatory': True} for x in partitions],
+                path=(
+                    f'{S3_MANIFEST_DATAPATH}/{state.run_id}/{LOG_SOURCE}.json'
+                ),
+            )
+        },
+    )['path']
+
 
-def run(dry_run=True):
+@metrics.span('run')
+def run(dry_run=True, incremental=False, resume=False, export=False):
     """
     Orchestrates the application's "Operator" objects to create an AWS
     infrastructure and Redshift cluster. This function sets up all of the
@@ -25,6 +106,20 @@ def run(dry_run=True):
         infrastructure upon completion. This argument should be passed in the
         terminal when executing the application (see app.py).
 
+        incremental (bool): Set to True to load only the log data which
+        arrived since the last run. The existing tables are kept, new log
+        partitions are copied to the raw vault and merged into the
+        dimensional model. If no watermark has been recorded yet, a full load
+        is carried out instead.
+
+        resume (bool): Set to True to resume the last run if it did not
+        complete. Each stage and manifest task records its completion in the
+        run state file and the `etl_run_state` control table; stages which
+        completed with the same inputs are skipped.
+
+        export (bool): Set to True to export the tables of the dimensional
+        model to S3 as Parquet files once they have been loaded.
+
     Returns:
         None
     """
@@ -39,43 +134,404 @@ def run(dry_run=True):
     # instantiate operators
     iam = IAMOperator()
     red = RedshiftOperator()
+    s3 = S3Operator()
     sql = PostgreSQLOperator()
+    state = RunState(path=DWH_RUN_STATE_PATH, resume=resume)
+    plans = PlanCapture() if DWH_PLAN_CAPTURE != 'off' else None
+    stats = QueryStats(sql=sql, run_id=state.run_id)
 
     # setup aws infrastructure
-    iam.create_role()
-    iam.attach_role_policies()
-    red.create_redshift_cluster(role_arn=iam.dwh_role_arn)
+    def setup_role():
+        if iam.role_mode == 'reconcile':
+            iam.reconcile_role()
+            return {'role_arn': iam.dwh_role_arn}
+        if red.provisioning == 'pause' and iam.get_role():
+            # keep the role the paused cluster was created with
+            return {'role_arn': iam.dwh_role_arn}
+        iam.create_role()
+        iam.attach_role_policies()
+        return {'role_arn': iam.dwh_role_arn}
+
+    outputs = state.run_stage(
+        stage='iam',
+        inputs=(
+            iam.dwh_db_role,
+            iam.dwh_trust_policy,
+            iam.aws_role_policies,
+            iam.aws_inline_policies,
+        ),
+        func=setup_role,
+    )
+    iam.dwh_role_arn = outputs['role_arn']
+
+    if red.cluster_status != 'available':
+        state.invalidate('cluster')
+
+    schema_version = fingerprint(create_tables)
+    table_manifest = apply_layouts(
+        manifest=create_tables,
+        layouts=load_layouts(path=DWH_TABLE_LAYOUT_PATH),
+    )
+    outputs = state.run_stage(
+        stage='cluster',
+        inputs=(red.dwh_cluster_id, red.dwh_node_type, red.dwh_num_nodes),
+        func=lambda: {
+            'path': red.provision_cluster(
+                role_arn=iam.dwh_role_arn,
+                schema_version=schema_version,
+            )
+        },
+    )
+
+    if outputs.get('path') in ['restore', 'resume'] and not incremental:
+        logger.info(
+            f"Cluster provisioned by {outputs['path']}, loading new data only"
+        )
+        incremental = True
 
     # create postgresql connection
     sql.create_connection(endpoint=red.cluster_endpoint)
 
-    # create data warehouse vaults
+    # create data warehouse vaults, which hold the run state control table
     sql.setup_vaults(query=create_schema)
+    state.attach(sql=sql)
+
+    watermark = None
+
+    if incremental:
+        # create missing tables and read the last loaded log partition
+        sql.execute_batch(statements=table_manifest)
+        watermark = sql.get_watermark(source=LOG_SOURCE)
+
+        if watermark is None:
+            logger.info('No watermark recorded, running a full load')
+            incremental = False
+
+    if incremental:
+        # find new log partitions, pinned for the lifetime of the run
+        partitions = state.run_stage(
+            stage='list_log_partitions',
+            inputs=(S3_LOG_DATAPATH, watermark),
+            func=lambda: {
+                'partitions': s3.list_keys(
+                    path=S3_LOG_DATAPATH,
+                    start_after=watermark,
+                )
+            },
+        )['partitions']
+        logger.info(f'{len(partitions)} new log partitions found')
+
+        if partitions:
+            # load new log partitions to the raw_vault
+            state.run_stage(
+                stage='truncate_log_data',
+                inputs=(partitions,),
+                func=lambda: sql.truncate_table(
+                    schema=DWH_DB_RAW_VAULT,
+                    table=LOG_SOURCE,
+                ),
+            )
+            if S3_MANIFEST_DATAPATH:
+                log_manifest = copy_log_manifest(path=write_log_manifest(
+                    s3=s3,
+                    state=state,
+                    partitions=partitions,
+                ))
+            else:
+                logger.warning(
+                    'S3_MANIFEST_DATAPATH is not set, log partitions are '
+                    'copied one object at a time'
+                )
+                log_manifest = copy_log_partitions(paths=partitions)
+
+            # COPYs into the same table are serialised by its lock, so the
+            # objects of the fallback manifest are copied one after another
+            copy_parallelism = (
+                DWH_COPY_PARALLELISM if S3_MANIFEST_DATAPATH else 1
+            )
+
+            with metrics.span('copy_data'), stats.stage('copy_data'):
+                sql.copy_s3_data(
+                    manifest=state.pending(
+                        stage='copy_data',
+                        manifest=log_manifest,
+                    ),
+                    role_arn=iam.dwh_role_arn,
+                    parallelism=copy_parallelism,
+                    on_complete=lambda task: state.complete_task(
+                        'copy_data', task
+                    ),
+                )
+
+            # merge new data into public_vault tables
+            stage = 'incremental_data'
+            with metrics.span(stage), stats.stage(stage):
+                sql.execute_tasks(
+                    manifest=state.pending(
+                        stage=stage,
+                        manifest=incremental_data,
+                    ),
+                    concurrency=DWH_MAX_CONCURRENCY,
+                    on_complete=lambda task: state.complete_task(
+                        'incremental_data', task
+                    ),
+                    plans=plans,
+                )
+            watermark = partitions[-1]
+            sql.set_watermark(source=LOG_SOURCE, watermark=watermark)
+    else:
+        # drop existing tables
+        state.run_stage(
+            stage='drop_tables',
+            inputs=(),
+            func=sql.drop_tables,
+        )
+
+        # create new tables
+        state.run_stage(
+            stage='create_tables',
+            inputs=(table_manifest,),
+            func=lambda: sql.execute_batch(statements=table_manifest),
+        )
+
+        # load data to raw_vault tables
+        log_objects = state.run_stage(
+            stage='list_log_partitions',
+            inputs=(S3_LOG_DATAPATH,),
+            func=lambda: {'objects': s3.list_objects(path=S3_LOG_DATAPATH)},
+        )['objects']
+        partitions = [x['path'] for x in log_objects]
+
+        load_manifest = copy_data
+        # whether the log data loaded is exactly the listed partitions
+        pinned = False
+
+        if S3_STAGING_DATAPATH:
+            # pack source data into slice-aligned gzip or parquet objects
+            sources = {SONG_SOURCE: S3_SONG_DATAPATH}
+
+            if DWH_STAGING_FORMAT == 'parquet':
+                sources[LOG_SOURCE] = S3_LOG_DATAPATH
+
+            staging = StagingOperator(s3=s3)
+            slices = sql.get_slice_count()
+            manifests = {}
+
+            for table, source in sources.items():
+                manifests[table] = state.run_stage(
+                    stage=f'stage_{table}',
+                    inputs=(
+                        source,
+                        S3_STAGING_DATAPATH,
+                        DWH_STAGING_FORMAT,
+                        raw_schemas[table],
+                    ),
+                    func=lambda: {
+                        'manifest': staging.stage(
+                            source=source,
+                            destination=f'{S3_STAGING_DATAPATH}/{table}',
+                            slices=slices,
+                            columns=(
+                                raw_schemas[table]
+                                if DWH_STAGING_FORMAT == 'parquet' else None
+                            ),
+                            objects=(
+                                log_objects if table == LOG_SOURCE else None
+                            ),
+                        )
+                    },
+                )['manifest']
 
-    # drop existing tables
-    sql.drop_tables()
+            load_manifest = copy_staged_data(
+                manifests=manifests,
+                file_format=DWH_STAGING_FORMAT,
+            )
+            pinned = LOG_SOURCE in manifests
+
+        if not pinned and partitions and S3_MANIFEST_DATAPATH:
+            load_manifest = copy_log_manifest(
+                path=write_log_manifest(
+                    s3=s3,
+                    state=state,
+                    partitions=partitions,
+                ),
+                manifest=load_manifest,
+            )
+            pinned = True
+
+        with metrics.span('copy_data'), stats.stage('copy_data'):
+            summary = sql.copy_s3_data(
+                manifest=state.pending(
+                    stage='copy_data',
+                    manifest=load_manifest,
+                ),
+                role_arn=iam.dwh_role_arn,
+                parallelism=DWH_COPY_PARALLELISM,
+                on_complete=lambda task: state.complete_task(
+                    'copy_data', task
+                ),
+            )
+
+        # clean and load data to public_vault tables
+        with metrics.span('transform_data'), stats.stage('transform_data'):
+            sql.execute_tasks(
+                manifest=state.pending(
+                    stage='transform_data',
+                    manifest=transform_data,
+                ),
+                concurrency=DWH_MAX_CONCURRENCY,
+                on_complete=lambda task: state.complete_task(
+                    'transform_data', task
+                ),
+                plans=plans,
+            )
+
+        # without a manifest, the COPY of the log prefix may have loaded
+        # objects which arrived after the listing
+        loaded = [
+            x['last_file'] for x in summary
+            if x['table'] == f'{DWH_DB_RAW_VAULT}.{LOG_SOURCE}'
+            and x['last_file']
+        ]
+
+        if partitions:
+            watermark = partitions[-1]
+            if not pinned and loaded:
+                watermark = max(watermark, loaded[0])
+            sql.set_watermark(source=LOG_SOURCE, watermark=watermark)
+
+    # rebuild tables whose distribution or sort keys should change
+    with stats.stage('distribution'):
+        state.run_stage(
+            stage='distribution',
+            inputs=(watermark,),
+            func=lambda: rebuild_layouts(
+                sql=sql,
+                manifest=table_manifest,
+                schema_name=DWH_DB_PUBLIC_VAULT,
+                path=DWH_TABLE_LAYOUT_PATH,
+            ),
+        )
+    table_manifest = apply_layouts(
+        manifest=create_tables,
+        layouts=load_layouts(path=DWH_TABLE_LAYOUT_PATH),
+    )
+
+    # vacuum and analyze the tables which need it
+    with stats.stage('maintenance'):
+        state.run_stage(
+            stage='maintenance',
+            inputs=(watermark,),
+            func=lambda: sql.maintain_tables(
+                plan=plan_maintenance(
+                    table_info=sql.get_table_info(),
+                    rebuildable={
+                        (x['vault'], x['table']) for x in create_tables
+                    },
+                ),
+                manifest=table_manifest,
+            ),
+        )
 
-    # create new tables
-    sql.execute_tasks(manifest=create_tables)
+    if export and not S3_EXPORT_DATAPATH:
+        logger.info('S3_EXPORT_DATAPATH is not set, skipping export')
+    elif export:
+        # export public_vault tables to s3 as parquet
+        with metrics.span('export_data'), stats.stage('export_data'):
+            sql.unload_s3_data(
+                manifest=state.pending(
+                    stage='export_data',
+                    manifest=export_data,
+                ),
+                role_arn=iam.dwh_role_arn,
+                parallelism=DWH_MAX_CONCURRENCY,
+                on_complete=lambda task: state.complete_task(
+                    'export_data', task
+                ),
+            )
 
-    # load data to raw_vault tables
-    sql.copy_s3_data(manifest=copy_data, role_arn=iam.dwh_role_arn)
+    if plans and plans.plans:
+        # store query plans with the run state
+        plans.save(path=os.path.join(
+            os.path.dirname(DWH_RUN_STATE_PATH),
+            'plans',
+            f'{state.run_id}.json',
+        ))
 
-    # clean and load data to public_vault tables
-    sql.execute_tasks(manifest=transform_data)
+    # store query statistics with the run state
+    stats.save(path=os.path.join(
+        os.path.dirname(DWH_RUN_STATE_PATH),
+        'reports',
+        f'{state.run_id}.json',
+    ))
 
     # close database connection
     logger.info(f'Cluster endpoint: {red.cluster_endpoint}')
     sql.close_connection()
+    red.log_cache_stats()
+    red.log_phase_timings()
+    state.finish()
 
     if dry_run:
         # teardown AWS infrastructure and Redshift cluster
-        iam.teardown()
-        red.teardown()
+        if red.provisioning != 'pause':
+            iam.teardown()
+
+        if red.provisioning == 'snapshot':
+            red.teardown(
+                snapshot_id=red.snapshot_identifier(
+                    schema_version=schema_version,
+                    watermark=watermark,
+                )
+            )
+        else:
+            red.teardown()
 
     logger.info('ETL operation completed')
 
 
+def advise(apply=False):
+    """
+    Compare the compression encodings declared for the tables of the
+    dimensional model with those recommended by ANALYZE COMPRESSION on the
+    running cluster. The estimated savings are logged and revised DDL is
+    written to the path set by DWH_COMPRESSION_DDL_PATH.
+
+    Args:
+        apply (bool): Set to True to rebuild the tables with the revised
+        encodings through a deep copy.
+
+    Returns:
+        dict
+    """
+    red = RedshiftOperator()
+    sql = PostgreSQLOperator()
+
+    if red.cluster_status != 'available':
+        logger.info('Cluster is not available, nothing to analyze')
+        return {}
+
+    sql.create_connection(endpoint=red.cluster_endpoint)
+
+    try:
+        advice = advise_compression(
+            sql=sql,
+            manifest=[
+                x for x in apply_layouts(
+                    manifest=create_tables,
+                    layouts=load_layouts(path=DWH_TABLE_LAYOUT_PATH),
+                )
+                if x['vault'] == DWH_DB_PUBLIC_VAULT
+            ],
+            output_path=DWH_COMPRESSION_DDL_PATH,
+            apply=apply,
+        )
+    finally:
+        sql.close_connection()
+
+    return advice
+
+
 if __name__ == '__main__':
 
     run()
@@ -0,0 +1,92 @@
+from core.logger import log
+from settings.envs import (
+    DWH_MAINTENANCE_DEEP_COPY_PCT,
+    DWH_MAINTENANCE_DELETED_PCT,
+    DWH_MAINTENANCE_STATS_OFF_PCT,
+    DWH_MAINTENANCE_UNSORTED_PCT,
+)
+
+logger = log.setup_custom_logger(__name__)
+
+THRESHOLDS = {
+    'unsorted': DWH_MAINTENANCE_UNSORTED_PCT,
+    'deep_copy': DWH_MAINTENANCE_DEEP_COPY_PCT,
+    'deleted': DWH_MAINTENANCE_DELETED_PCT,
+    'stats_off': DWH_MAINTENANCE_STATS_OFF_PCT,
+}
+
+
+def plan_table(info, rebuildable=True, thresholds=THRESHOLDS):
+    """
+    Decide which maintenance actions a table needs from its row of the
+    svv_table_info system view. A table which is mostly unsorted is rebuilt
+    with a deep copy, which is cheaper than a VACUUM of the whole table;
+    otherwise the unsorted region and deleted rows are vacuumed separately.
+    Statistics are refreshed when they are stale or the table was rebuilt.
+    Healthy and empty tables need no actions.
+
+    Args:
+        info (dict): The table's tbl_rows, estimated_visible_rows, unsorted
+        and stats_off values.
+
+        rebuildable (bool): Whether the table's DDL is known, so that it can
+        be rebuilt with a deep copy.
+
+        thresholds (dict): Percentages above which an action is taken.
+
+    Returns:
+        list: Actions from 'deep_copy', 'vacuum_delete', 'vacuum_sort' and
+        'analyze', in the order they should run.
+    """
+    if not info['tbl_rows']:
+        return []
+
+    visible = min(info['estimated_visible_rows'], info['tbl_rows'])
+    deleted = 100 * (info['tbl_rows'] - visible) / info['tbl_rows']
+    actions = []
+
+    if info['unsorted'] >= thresholds['deep_copy'] and rebuildable:
+        actions.append('deep_copy')
+    else:
+        if deleted >= thresholds['deleted']:
+            actions.append('vacuum_delete')
+        if info['unsorted'] >= thresholds['unsorted']:
+            actions.append('vacuum_sort')
+
+    if actions or info['stats_off'] >= thresholds['stats_off']:
+        actions.append('analyze')
+
+    return actions
+
+
+def plan_maintenance(table_info, rebuildable=()):
+    """
+    Plan the maintenance of each table reported by
+    PostgreSQLOperator.get_table_info(), leaving out healthy tables.
+
+    Args:
+        table_info (list): Dictionaries describing the health of each table.
+
+        rebuildable (set): (schema, table) tuples of the tables whose DDL is
+        known.
+
+    Returns:
+        list: Dictionaries of the schema, table and actions of each table
+        which needs maintenance.
+    """
+    plan = []
+
+    for info in table_info:
+        key = (info['schema'], info['table'])
+        actions = plan_table(info=info, rebuildable=key in rebuildable)
+
+        if actions:
+            plan.append(dict(info, actions=actions))
+        else:
+            logger.debug(f"'{key[0]}.{key[1]}' is healthy, skipped")
+
+    logger.info(
+        f'{len(plan)} of {len(table_info)} tables need maintenance'
+    )
+
+    return plan
@@ -0,0 +1,199 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+
+from core.logger import log
+from settings.envs import (
+    DWH_PLAN_BASELINE_PATH,
+    DWH_PLAN_CAPTURE,
+    DWH_PLAN_REGRESSION_PCT,
+)
+
+logger = log.setup_custom_logger(__name__)
+
+# plan steps which move or multiply rows across the cluster
+COSTLY_STEPS = ('DS_BCAST_INNER', 'DS_DIST_BOTH', 'Nested Loop')
+
+# statements which EXPLAIN accepts
+EXPLAINABLE = re.compile(
+    r'^\s*(SELECT|INSERT|UPDATE|DELETE|CREATE\s+(TEMP\s+)?TABLE\s+\w+\s+AS)',
+    re.IGNORECASE,
+)
+
+# upper bound of the cost of the top step of a plan
+PLAN_COST = re.compile(r'cost=[\d.]+\.\.([\d.]+)')
+
+
+def split_statements(script):
+    """
+    Split a rendered SQL script into its statements. Transaction control
+    statements are left out, as the caller runs the script in a single
+    transaction of its own.
+
+    Args:
+        script (string): The rendered SQL script.
+
+    Returns:
+        list
+    """
+    statements = [x.strip() for x in script.split(';')]
+
+    return [
+        x for x in statements
+        if x and x.upper() not in ('BEGIN', 'COMMIT', 'END')
+    ]
+
+
+def is_explainable(statement):
+    """
+    Return True if EXPLAIN can be run on a statement.
+
+    Args:
+        statement (string): A SQL statement.
+
+    Returns:
+        bool
+    """
+    return bool(EXPLAINABLE.match(statement))
+
+
+def parse_plan(lines):
+    """
+    Return the total cost of a query plan and the costly steps it contains.
+
+    Args:
+        lines (list): The lines of text returned by EXPLAIN.
+
+    Returns:
+        tuple: The cost of the top step and a list of costly steps.
+    """
+    match = PLAN_COST.search(lines[0]) if lines else None
+    cost = float(match.group(1)) if match else 0.0
+    flags = sorted({
+        step for line in lines for step in COSTLY_STEPS if step in line
+    })
+
+    return cost, flags
+
+
+class PlanCapture:
+
+    def __init__(self, action=DWH_PLAN_CAPTURE,
+                 baseline_path=DWH_PLAN_BASELINE_PATH,
+                 tolerance_pct=DWH_PLAN_REGRESSION_PCT):
+
+        self.action = action
+        self.baseline_path = baseline_path
+        self.tolerance_pct = tolerance_pct
+        self.baseline = self.load_baseline()
+        self.plans = {}
+        self.lock = threading.Lock()
+
+    def load_baseline(self):
+        """
+        Load the saved plan costs which new plans are compared with.
+
+        Returns:
+            dict
+        """
+        if not os.path.exists(self.baseline_path):
+            return {}
+
+        with open(self.baseline_path) as f:
+            return json.load(f)
+
+    def record(self, task, index, statement, lines):
+        """
+        Record the plan of one statement of a transform and compare its cost
+        with the baseline. Costly steps are logged as warnings. A cost more
+        than `tolerance_pct` above the baseline is a regression, which is
+        logged or, if the action is 'fail', raised before the statement
+        runs. Statements without a baseline, or whose text has changed since
+        it was saved, set a new one.
+
+        Args:
+            task (string): Name of the transform task.
+
+            index (int): Position of the statement in the transform.
+
+            statement (string): The SQL statement.
+
+            lines (list): The lines of text returned by EXPLAIN.
+
+        Returns:
+            dict
+        """
+        key = f'{task}:{index}'
+        digest = hashlib.sha256(statement.encode('utf-8')).hexdigest()[:16]
+        cost, flags = parse_plan(lines)
+        baseline = self.baseline.get(key)
+        regressed = False
+
+        if baseline and baseline['statement'] == digest:
+            limit = baseline['cost'] * (1 + self.tolerance_pct / 100)
+            regressed = cost > limit
+
+        plan = {
+            'statement': digest,
+            'cost': cost,
+            'baseline_cost': baseline['cost'] if baseline else None,
+            'flags': flags,
+            'regressed': regressed,
+            'plan': lines,
+        }
+
+        with self.lock:
+            self.plans[key] = plan
+
+        if flags:
+            logger.warning(f"Plan of '{key}' contains {', '.join(flags)}")
+
+        if regressed:
+            message = (
+                f"Plan cost of '{key}' regressed from {baseline['cost']} "
+                f"to {cost}"
+            )
+            if self.action == 'fail':
+                raise RuntimeError(message)
+            logger.warning(message)
+
+        return plan
+
+    def save(self, path):
+        """
+        Write the plans captured in this run to a file and add the plans of
+        new or changed statements to the baseline.
+
+        Args:
+            path (string): Path of the file to write the plans to.
+
+        Returns:
+            None
+        """
+        for key, plan in self.plans.items():
+            baseline = self.baseline.get(key)
+            if not baseline or baseline['statement'] != plan['statement']:
+                self.baseline[key] = {
+                    'statement': plan['statement'],
+                    'cost': plan['cost'],
+                }
+
+        for file_path, payload in (
+                (path, {
+                    'captured_at': datetime.datetime.utcnow().isoformat(),
+                    'plans': self.plans,
+                }),
+                (self.baseline_path, self.baseline)):
+            os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+            with open(file_path, 'w') as f:
+                json.dump(payload, f, indent=2, sort_keys=True)
+
+        regressions = sum(x['regressed'] for x in self.plans.values())
+        flagged = sum(bool(x['flags']) for x in self.plans.values())
+        logger.info(
+            f'{len(self.plans)} plans written to {path}, {flagged} with '
+            f'costly steps, {regressions} regressed'
+        )
@@ -0,0 +1,186 @@
+import concurrent.futures
+
+from core.logger import (
+    log,
+    metrics,
+)
+
+logger = log.setup_custom_logger(__name__)
+
+
+def task_name(task):
+    """
+    Return the name of a manifest task. A task is named by its `name` key,
+    when it has one, or after the table it writes to, falling back to the
+    name of its SQL query function.
+
+    Args:
+        task (dict): A manifest task.
+
+    Returns:
+        string
+    """
+    return (
+        task.get('name')
+        or task.get('public_table')
+        or task.get('table')
+        or task['query'].__name__
+    )
+
+
+def task_inputs(task):
+    """
+    Return the names of the tables and tasks a manifest task reads from. The
+    inputs are inferred from the task's `raw_table` key and extended with any
+    task names declared explicitly in its `depends_on` key.
+
+    Args:
+        task (dict): A manifest task.
+
+    Returns:
+        set
+    """
+    raw_tables = task.get('raw_table') or ()
+    depends_on = task.get('depends_on') or ()
+
+    if isinstance(raw_tables, str):
+        raw_tables = (raw_tables,)
+
+    if isinstance(depends_on, str):
+        depends_on = (depends_on,)
+
+    return set(raw_tables) | set(depends_on)
+
+
+def resolve_dependencies(manifest):
+    """
+    Build the dependency graph of a manifest. A task depends on another task
+    in the same manifest when it reads the table the other task writes to, or
+    when it names the other task in its `depends_on` key. Inputs produced
+    outside of the manifest, such as the raw vault tables loaded from S3, are
+    satisfied by an earlier stage and are ignored.
+
+    Args:
+        manifest (list): A list of task dictionaries.
+
+    Returns:
+        dict: Task name mapped to the set of upstream task names.
+    """
+    names = [task_name(task) for task in manifest]
+
+    if len(names) != len(set(names)):
+        raise ValueError(f'Manifest contains duplicate task names: {names}')
+
+    graph = {}
+
+    for task in manifest:
+        name = task_name(task)
+        explicit = task.get('depends_on') or ()
+
+        if isinstance(explicit, str):
+            explicit = (explicit,)
+
+        unknown = set(explicit) - set(names)
+        if unknown:
+            raise ValueError(
+                f"Task '{name}' depends on unknown tasks: {sorted(unknown)}"
+            )
+
+        graph[name] = {x for x in task_inputs(task) if x in names} - {name}
+
+    # reject cycles before any work is scheduled
+    visited = set()
+    path = set()
+
+    def visit(node):
+        if node in path:
+            raise ValueError(f"Dependency cycle detected at task '{node}'")
+        if node in visited:
+            return
+        path.add(node)
+        for upstream in graph[node]:
+            visit(upstream)
+        path.remove(node)
+        visited.add(node)
+
+    for name in names:
+        visit(name)
+
+    return graph
+
+
+class TaskScheduler:
+
+    def __init__(self, max_workers=1):
+
+        self.max_workers = max(1, int(max_workers))
+
+    def run(self, manifest, func):
+        """
+        Execute every task of a manifest with `func`, running tasks whose
+        upstream tasks have completed at the same time, up to `max_workers`
+        tasks at once. Tasks are submitted in manifest order whenever they
+        become ready. If a task fails, no further tasks are submitted and the
+        exception is raised once the running tasks have finished.
+
+        Each task runs in a metrics span nested under the span the scheduler
+        was started from.
+
+        Args:
+            manifest (list): A list of task dictionaries.
+
+            func (callable): Function called with a single task dictionary,
+            it is invoked from a worker thread.
+
+        Returns:
+            dict: Task name mapped to the return value of `func`.
+        """
+        graph = resolve_dependencies(manifest)
+        parent = metrics.current_span()
+
+        def run_task(task):
+            with metrics.span(task_name(task), parent=parent):
+                return func(task)
+
+        tasks = {task_name(task): task for task in manifest}
+        pending = list(tasks)
+        completed = {}
+        running = {}
+        error = None
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers) as executor:
+
+            while pending or running:
+
+                if error is None:
+                    for name in list(pending):
+                        if len(running) >= self.max_workers:
+                            break
+                        if graph[name] <= completed.keys():
+                            pending.remove(name)
+                            future = executor.submit(run_task, tasks[name])
+                            running[future] = name
+                            logger.debug(f"Task '{name}' submitted")
+
+                if not running:
+                    break
+
+                done, _ = concurrent.futures.wait(
+                    running,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        completed[name] = future.result()
+                    except Exception as e:
+                        logger.error(f"Task '{name}' failed: {e}")
+                        if error is None:
+                            error = e
+
+        if error is not None:
+            raise error
+
+        return completed
@@ -0,0 +1,167 @@
+import contextlib
+import datetime
+import json
+import os
+
+import psycopg2
+
+from core.logger import log
+from settings.envs import DWH_QUERY_STATS
+
+logger = log.setup_custom_logger(__name__)
+
+# statistics which are summed into the totals of a stage
+TOTALS = (
+    'queries', 'aborted', 'elapsed_secs', 'queue_secs', 'exec_secs',
+    'rows_scanned', 'bytes_scanned', 'spilled_steps', 'files_loaded',
+    'lines_loaded',
+)
+
+
+def query_label(run_id, stage):
+    """
+    Return the query_group label of the queries of a stage of a run. The
+    queries of each manifest task are labelled '<run_id>:<stage>:<task>'.
+
+    Args:
+        run_id (string): Identifier of the run.
+
+        stage (string): Name of the stage.
+
+    Returns:
+        string
+    """
+    return f'{run_id}:{stage}'
+
+
+def summarise(rows, label):
+    """
+    Key the statistics of a stage by task and sum them into totals. Queries
+    labelled with the stage alone, rather than one of its tasks, are listed
+    under the name of the stage.
+
+    Args:
+        rows (list): Dictionaries returned by
+        PostgreSQLOperator.get_query_stats().
+
+        label (string): The query_group label of the stage.
+
+    Returns:
+        dict
+    """
+    tasks = {}
+
+    for row in rows:
+        name = row['label'][len(label) + 1:] or label.rsplit(':', 1)[-1]
+        tasks[name] = {k: v for k, v in row.items() if k != 'label'}
+
+    totals = {
+        key: round(sum(x[key] for x in tasks.values()), 2) for key in TOTALS
+    }
+
+    return {'totals': totals, 'tasks': tasks}
+
+
+class QueryStats:
+
+    def __init__(self, sql, run_id, enabled=DWH_QUERY_STATS):
+
+        self.sql = sql
+        self.run_id = run_id
+        self.enabled = enabled
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager which labels the queries run inside a `with` block
+        with the query_group of a stage, then collects their statistics from
+        the system tables. Statistics are collected for failed stages too.
+
+        Args:
+            name (string): Name of the stage.
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            yield
+            return
+
+        label = query_label(run_id=self.run_id, stage=name)
+        self.sql.query_label = label
+
+        try:
+            yield
+        finally:
+            self.sql.query_label = None
+            self.collect(stage=name, label=label)
+
+    def collect(self, stage, label):
+        """
+        Collect and log the statistics of the queries of a stage. Stages
+        which ran no queries, such as those skipped by a resumed run, are
+        left out of the report.
+
+        Args:
+            stage (string): Name of the stage.
+
+            label (string): The query_group label of the stage.
+
+        Returns:
+            None
+        """
+        try:
+            rows = self.sql.get_query_stats(label=label)
+        except psycopg2.Error as e:
+            logger.warning(f"Query statistics of '{stage}' not collected: {e}")
+            return
+
+        if not rows:
+            return
+
+        self.stages[stage] = summarise(rows=rows, label=label)
+        totals = self.stages[stage]['totals']
+
+        logger.info(
+            f"'{stage}' ran {totals['queries']} queries: "
+            f"{totals['queue_secs']} secs queued, {totals['exec_secs']} secs "
+            f"executing, {round(totals['bytes_scanned'] / 2 ** 20, 1)} MB "
+            f"scanned, {totals['files_loaded']} files loaded"
+        )
+
+        for task, row in self.stages[stage]['tasks'].items():
+            if row['spilled_steps']:
+                logger.warning(
+                    f"'{stage}:{task}' spilled to disk in "
+                    f"{row['spilled_steps']} query steps"
+                )
+
+    def save(self, path):
+        """
+        Write the statistics collected in this run to a JSON report.
+
+        Args:
+            path (string): Path of the report.
+
+        Returns:
+            None
+        """
+        if not self.stages:
+            return
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        with open(path, 'w') as f:
+            json.dump(
+                {
+                    'run_id': self.run_id,
+                    'collected_at': datetime.datetime.utcnow().isoformat(),
+                    'stages': self.stages,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+        logger.info(f'Query statistics written to {path}')
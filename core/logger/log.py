@@ -1,20 +1,163 @@
+import copy
+import json
 import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+import threading
 
+from settings.envs import (
+    DWH_LOG_FORMAT,
+    DWH_LOG_LEVEL,
+)
 
-LEVEL = 'DEBUG'
+LEVEL = DWH_LOG_LEVEL.upper()
 FORMAT = (
     '%(asctime)s | Module: %(module)s | Function: %(funcName)s | %(message)s'
 )
 DATEFMT = '%Y-%m-%d %H:%M:%S'
 
 
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        """
+        Format a log record as a single line JSON object, for log shippers
+        which parse structured logs.
+
+        Args:
+            record (logging.LogRecord): The record to format.
+
+        Returns:
+            string
+        """
+        payload = {
+            'time': self.formatTime(record, DATEFMT),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'function': record.funcName,
+            'process': record.process,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exception'] = record.exc_text
+
+        return json.dumps(payload, default=str)
+
+
+def create_formatter(log_format=DWH_LOG_FORMAT):
+    """
+    Return the formatter of the log output, 'text' or 'json'.
+
+    Args:
+        log_format (string): The format of the log output.
+
+    Returns:
+        logging.Formatter
+    """
+    if log_format == 'json':
+        return JsonFormatter()
+
+    return logging.Formatter(fmt=FORMAT, datefmt=DATEFMT)
+
+
+class ProcessQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler shared by every logger of the application. Records are
+    put on a queue and written to stderr by a listener thread, so that the
+    threads which log never wait on the stream. Each process, including the
+    workers of a process pool, starts its own queue and listener on its
+    first record.
+    """
+
+    def __init__(self):
+
+        super().__init__(queue=None)
+        self.pid = None
+        self.listener = None
+        self.setup_lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the queue and listener of the current process, unless they
+        are already running. The listener is stopped, and its queue drained,
+        when the process exits. The stop is registered as a multiprocessing
+        finalizer rather than with atexit, since the workers of a process
+        pool exit through os._exit(), which skips atexit handlers, but run
+        the finalizers of their own process first.
+
+        Returns:
+            None
+        """
+        if self.pid == os.getpid():
+            return
+
+        with self.setup_lock:
+            if self.pid == os.getpid():
+                return
+
+            handler = logging.StreamHandler()
+            handler.setFormatter(create_formatter())
+
+            self.queue = queue.SimpleQueue()
+            self.listener = logging.handlers.QueueListener(self.queue, handler)
+            self.listener.start()
+            self.pid = os.getpid()
+
+            multiprocessing.util.Finalize(
+                None, self.listener.stop, exitpriority=10
+            )
+
+    def prepare(self, record):
+        """
+        Prepare a record for the queue. As in QueueHandler, the message is
+        merged with its arguments, which may not be picklable, but the
+        traceback is kept apart as exc_text, so that the formatter of the
+        listener can place it, rather than find it inside the message.
+
+        Args:
+            record (logging.LogRecord): The record to enqueue.
+
+        Returns:
+            logging.LogRecord
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info
+            )
+        record.exc_info = None
+
+        return record
+
+    def enqueue(self, record):
+
+        self.start()
+        self.queue.put_nowait(record)
+
+
+handler = ProcessQueueHandler()
+
+
 def setup_custom_logger(name):
     """
-    Sets up a custom logger for use in the application. The logging level
-    is set to DEBUG by default; all debug messages will be logged to the
-    terminal.
+    Sets up a custom logger for use in the application. Every logger shares
+    one queue handler, which is only attached once, so calling this function
+    again for the same module does not duplicate its output.
 
-    Set LEVEL to 'INFO' to disable the debug information.
+    The logging level is read from DWH_LOG_LEVEL, in the LOGGING section of
+    dwh.cfg or the environment, and is INFO by default; set it to DEBUG to
+    log debug information. Set DWH_LOG_FORMAT to 'json' to log JSON lines.
 
     Args:
         name: __name__ property of module you are instantiating a logger
@@ -23,13 +166,10 @@ def setup_custom_logger(name):
     Returns:
         logging.Logger
     """
-    formatter = logging.Formatter(fmt=FORMAT, datefmt=DATEFMT)
-
-    handler = logging.StreamHandler()
-    handler.setFormatter(formatter)
-
     logger = logging.getLogger(name)
     logger.setLevel(LEVEL)
-    logger.addHandler(handler)
+
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
 
     return logger
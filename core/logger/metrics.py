@@ -0,0 +1,333 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+from settings.envs import (
+    DWH_METRICS_JSONL_PATH,
+    DWH_METRICS_PROM_PATH,
+)
+
+PREFIX = 'dwh'
+
+
+def format_labels(labels):
+    """
+    Render the labels of a metric in the Prometheus exposition format.
+
+    Args:
+        labels (tuple): Sorted (name, value) pairs.
+
+    Returns:
+        string
+    """
+    if not labels:
+        return ''
+
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', r'\\').replace('"', r'\"')
+        pairs.append(f'{name}="{value}"')
+
+    return '{' + ','.join(pairs) + '}'
+
+
+class MetricsRegistry:
+
+    def __init__(self, prom_path=DWH_METRICS_PROM_PATH,
+                 jsonl_path=DWH_METRICS_JSONL_PATH, prefix=PREFIX):
+
+        self.prom_path = prom_path
+        self.jsonl_path = jsonl_path
+        self.prefix = prefix
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stream = None
+        self.pid = None
+
+    def key(self, name, labels):
+
+        return f'{self.prefix}_{name}', tuple(sorted(labels.items()))
+
+    def emit(self, event):
+        """
+        Append an event to the JSON lines file. Each process opens the file
+        for itself, so that the workers of a process pool can write to it.
+
+        Args:
+            event (dict): The event to write.
+
+        Returns:
+            None
+        """
+        if not self.jsonl_path:
+            return
+
+        line = json.dumps(dict(event, ts=time.time()), default=str)
+
+        with self.lock:
+            if self.pid != os.getpid():
+                directory = os.path.dirname(self.jsonl_path) or '.'
+                os.makedirs(directory, exist_ok=True)
+                self.stream = open(self.jsonl_path, 'a', buffering=1)
+                self.pid = os.getpid()
+            self.stream.write(line + '\n')
+
+    def counter(self, name, value=1, **labels):
+        """
+        Increment a counter.
+
+        Args:
+            name (string): Name of the counter, ending in '_total'.
+
+            value (float): Amount to add.
+
+            labels (dict): Labels of the series.
+
+        Returns:
+            None
+        """
+        key = self.key(name, labels)
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+        self.emit({'type': 'counter', 'name': key[0], 'value': value,
+                   'labels': labels})
+
+    def gauge(self, name, value, **labels):
+        """
+        Set a gauge to its current value.
+
+        Args:
+            name (string): Name of the gauge.
+
+            value (float): The current value.
+
+            labels (dict): Labels of the series.
+
+        Returns:
+            None
+        """
+        key = self.key(name, labels)
+
+        with self.lock:
+            self.gauges[key] = value
+
+        self.emit({'type': 'gauge', 'name': key[0], 'value': value,
+                   'labels': labels})
+
+    def observe(self, name, secs, **labels):
+        """
+        Record a duration. Durations are exported as a Prometheus summary,
+        the count and sum of the observations of each series.
+
+        Args:
+            name (string): Name of the timer, ending in '_seconds'.
+
+            secs (float): The duration in seconds.
+
+            labels (dict): Labels of the series.
+
+        Returns:
+            None
+        """
+        key = self.key(name, labels)
+
+        with self.lock:
+            count, total = self.timers.get(key, (0, 0.0))
+            self.timers[key] = (count + 1, total + secs)
+
+        self.emit({'type': 'timer', 'name': key[0], 'secs': round(secs, 6),
+                   'labels': labels})
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """
+        Context manager which records the duration of a `with` block.
+
+        Args:
+            name (string): Name of the timer.
+
+            labels (dict): Labels of the series.
+
+        Returns:
+            None
+        """
+        start_time = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def current_span(self):
+        """
+        Return the path of the innermost span open in the current thread.
+
+        Returns:
+            string
+        """
+        stack = getattr(self.local, 'spans', None)
+
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def span(self, name, parent=None):
+        """
+        Context manager, or decorator, which times a `with` block as a span.
+        Spans nest: a span is named by its path from the outermost span of
+        the thread, such as 'run/copy_data/raw__log_data'. Worker threads
+        pass the span they were started from as `parent`.
+
+        The duration of each span is recorded as dwh_span_seconds, labelled
+        with its path and status. When an outermost span closes, the
+        Prometheus textfile is written.
+
+        Args:
+            name (string): Name of the span.
+
+            parent (string): Optional path of the parent span.
+
+        Returns:
+            None
+        """
+        if not hasattr(self.local, 'spans'):
+            self.local.spans = []
+
+        parent = parent or self.current_span()
+        path = f'{parent}/{name}' if parent else name
+        status = 'error'
+        start_time = time.perf_counter()
+
+        self.local.spans.append(path)
+        self.emit({'type': 'span_start', 'span': path})
+
+        try:
+            yield
+            status = 'ok'
+        finally:
+            self.local.spans.pop()
+            secs = time.perf_counter() - start_time
+            self.observe('span_seconds', secs, span=path, status=status)
+
+            if parent is None:
+                if status == 'ok':
+                    self.gauge(
+                        'span_last_success_timestamp_seconds',
+                        round(time.time()),
+                        span=path,
+                    )
+                self.write_prometheus()
+
+    def instrument_client(self, client):
+        """
+        Register event hooks on a boto3 client which time each of its API
+        calls as dwh_aws_call_seconds and count failed calls as
+        dwh_aws_call_errors_total, labelled with the service and operation.
+
+        Args:
+            client (boto3.client): The client to instrument.
+
+        Returns:
+            boto3.client
+        """
+        service = client.meta.service_model.service_name
+
+        def before_call(model, context, **kwargs):
+            context['metrics_start_time'] = time.perf_counter()
+
+        def record(model, context, failed):
+            start_time = context.pop('metrics_start_time', None)
+            if start_time is None:
+                return
+            labels = {'service': service, 'operation': model.name}
+            self.observe(
+                'aws_call_seconds', time.perf_counter() - start_time, **labels
+            )
+            if failed:
+                self.counter('aws_call_errors_total', **labels)
+
+        def after_call(model, context, http_response=None, **kwargs):
+            status = getattr(http_response, 'status_code', 200)
+            record(model=model, context=context, failed=status >= 400)
+
+        def after_call_error(model, context, **kwargs):
+            record(model=model, context=context, failed=True)
+
+        client.meta.events.register('before-call', before_call)
+        client.meta.events.register('after-call', after_call)
+        client.meta.events.register('after-call-error', after_call_error)
+
+        return client
+
+    def to_prometheus(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            string
+        """
+        lines = []
+
+        with self.lock:
+            series = (
+                ('counter', self.counters, None),
+                ('gauge', self.gauges, None),
+                ('summary', self.timers, ('_count', '_sum')),
+            )
+
+            for kind, metrics, suffixes in series:
+                for name in sorted({x[0] for x in metrics}):
+                    lines.append(f'# TYPE {name} {kind}')
+                    for (metric, labels), value in sorted(metrics.items()):
+                        if metric != name:
+                            continue
+                        labels = format_labels(labels)
+                        if suffixes is None:
+                            lines.append(f'{name}{labels} {value}')
+                            continue
+                        for suffix, x in zip(suffixes, value):
+                            lines.append(f'{name}{suffix}{labels} {x}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=None):
+        """
+        Write every metric to a textfile for the node_exporter textfile
+        collector. The file is replaced atomically, so that the collector
+        never reads a partial file.
+
+        Args:
+            path (string): Optional path, DWH_METRICS_PROM_PATH by default.
+
+        Returns:
+            None
+        """
+        path = path or self.prom_path
+
+        if not path:
+            return
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+
+        with open(temp_path, 'w') as f:
+            f.write(self.to_prometheus())
+
+        os.replace(temp_path, path)
+
+
+registry = MetricsRegistry()
+
+counter = registry.counter
+gauge = registry.gauge
+observe = registry.observe
+timer = registry.timer
+span = registry.span
+current_span = registry.current_span
+instrument_client = registry.instrument_client
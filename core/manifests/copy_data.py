@@ -1,5 +1,6 @@
 from core.queries.sql import (
     copy_json_from_s3,
+    copy_parquet_from_s3,
 )
 from settings.envs import (
     AWS_REGION,
@@ -19,6 +20,7 @@ copy_data = [
         "vault": DWH_DB_RAW_VAULT,
         "table": "raw__log_data",
         "jsonpaths": S3_LOG_JSONPATH,
+        "analyze": ("artist", "page", "song", "ts", "user_id"),
     },
     {
         "query": copy_json_from_s3,
@@ -26,5 +28,97 @@ copy_data = [
         "region": AWS_REGION,
         "vault": DWH_DB_RAW_VAULT,
         "table": "raw__song_data",
+        "analyze": ("artist_id", "artist_name", "song_id", "title"),
     }
 ]
+
+
+def copy_log_partitions(paths):
+    """
+    Build a copy_data manifest which loads only the given S3 log data objects
+    into the raw vault. This is used by incremental runs to load the log
+    partitions that arrived after the last recorded watermark, when no COPY
+    manifest can be written. Each task is named after its object, relative
+    to the log data prefix, since every task writes to the same table.
+
+    Args:
+        paths (list): S3 paths of the log data objects to load.
+
+    Returns:
+        list
+    """
+    log_task = next(x for x in copy_data if x['table'] == 'raw__log_data')
+
+    return [
+        dict(
+            log_task,
+            bucket=path,
+            name=f"{log_task['table']}:"
+                 f"{path[len(S3_LOG_DATAPATH):].lstrip('/') or path}",
+        )
+        for path in paths
+    ]
+
+
+def copy_log_manifest(path, manifest=None):
+    """
+    Point the log data task of a copy_data manifest at a COPY manifest file,
+    so that exactly the log objects it lists are loaded by a single COPY,
+    rather than every object under the log prefix or one COPY per object.
+
+    Args:
+        path (string): S3 path of the COPY manifest file.
+
+        manifest (list): Optional copy_data manifest to update. By default
+        a manifest of the log data task alone is returned, as loaded by
+        incremental runs.
+
+    Returns:
+        list
+    """
+    if manifest is None:
+        manifest = [x for x in copy_data if x['table'] == 'raw__log_data']
+
+    return [
+        dict(task, bucket=path, manifest=True)
+        if task['table'] == 'raw__log_data' else task
+        for task in manifest
+    ]
+
+
+def copy_staged_data(manifests, file_format='json'):
+    """
+    Build a copy_data manifest in which the pre-staged raw vault tables are
+    loaded from the objects listed in the COPY manifest files written by the
+    StagingOperator, rather than from their bare S3 prefixes. Staged JSON is
+    gzip compressed, whereas staged Parquet is loaded with a FORMAT AS
+    PARQUET COPY.
+
+    Args:
+        manifests (dict): Raw vault table names mapped to the S3 path of
+        their COPY manifest file.
+
+        file_format (string): Format of the staged objects, 'json' or
+        'parquet'.
+
+    Returns:
+        list
+    """
+    tasks = []
+
+    for task in copy_data:
+        path = manifests.get(task['table'])
+
+        if path is None:
+            tasks.append(task)
+        elif file_format == 'parquet':
+            tasks.append(dict(
+                task,
+                query=copy_parquet_from_s3,
+                bucket=path,
+                manifest=True,
+            ))
+        else:
+            tasks.append(dict(task, bucket=path, manifest=True, gzip=True))
+
+    return tasks
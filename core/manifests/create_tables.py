@@ -3,6 +3,7 @@ from core.queries.sql import (
     create_table_dim_songs,
     create_table_dim_time,
     create_table_dim_users,
+    create_table_etl_watermarks,
     create_table_fact_songplays,
     create_table_raw_log_data,
     create_table_raw_song_data,
@@ -24,6 +25,11 @@ create_tables = [
         "vault": DWH_DB_RAW_VAULT,
         "table": "raw__song_data",
     },
+    {
+        "query": create_table_etl_watermarks,
+        "vault": DWH_DB_RAW_VAULT,
+        "table": "etl_watermarks",
+    },
     {
         "query": create_table_dim_artists,
         "vault": DWH_DB_PUBLIC_VAULT,
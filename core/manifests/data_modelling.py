@@ -1,4 +1,6 @@
 from core.queries.sql import (
+    merge_table_dim_time,
+    merge_table_dim_users,
     transform_table_dim_artists,
     transform_table_dim_songs,
     transform_table_dim_time,
@@ -48,3 +50,28 @@ transform_data = [
         "public_table": "fact_songplays",
     },
 ]
+
+
+incremental_data = [
+    {
+        "query": merge_table_dim_time,
+        "raw_vault": DWH_DB_RAW_VAULT,
+        "public_vault": DWH_DB_PUBLIC_VAULT,
+        "raw_table": "raw__log_data",
+        "public_table": "dim_time",
+    },
+    {
+        "query": merge_table_dim_users,
+        "raw_vault": DWH_DB_RAW_VAULT,
+        "public_vault": DWH_DB_PUBLIC_VAULT,
+        "raw_table": "raw__log_data",
+        "public_table": "dim_users",
+    },
+    {
+        "query": transform_table_fact_songplays,
+        "raw_vault": DWH_DB_RAW_VAULT,
+        "public_vault": DWH_DB_PUBLIC_VAULT,
+        "raw_table": ("raw__log_data", "raw__song_data"),
+        "public_table": "fact_songplays",
+    },
+]
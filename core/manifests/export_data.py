@@ -0,0 +1,44 @@
+from core.queries.sql import (
+    unload_table_by_month_to_s3,
+    unload_table_to_s3,
+)
+from settings.envs import (
+    DWH_DB_PUBLIC_VAULT,
+    S3_EXPORT_DATAPATH,
+)
+
+
+export_data = [
+    {
+        "query": unload_table_to_s3,
+        "bucket": S3_EXPORT_DATAPATH,
+        "public_vault": DWH_DB_PUBLIC_VAULT,
+        "public_table": "dim_artists",
+    },
+    {
+        "query": unload_table_to_s3,
+        "bucket": S3_EXPORT_DATAPATH,
+        "public_vault": DWH_DB_PUBLIC_VAULT,
+        "public_table": "dim_songs",
+    },
+    {
+        "query": unload_table_to_s3,
+        "bucket": S3_EXPORT_DATAPATH,
+        "public_vault": DWH_DB_PUBLIC_VAULT,
+        "public_table": "dim_time",
+        "partition_by": ("year", "month"),
+    },
+    {
+        "query": unload_table_to_s3,
+        "bucket": S3_EXPORT_DATAPATH,
+        "public_vault": DWH_DB_PUBLIC_VAULT,
+        "public_table": "dim_users",
+    },
+    {
+        "query": unload_table_by_month_to_s3,
+        "bucket": S3_EXPORT_DATAPATH,
+        "public_vault": DWH_DB_PUBLIC_VAULT,
+        "public_table": "fact_songplays",
+        "time_table": "dim_time",
+    },
+]
@@ -0,0 +1,37 @@
+# columns of the raw vault tables in table order, as tuples of the column
+# name, the json field it is read from and its arrow type; parquet columns
+# are mapped to the table by position when copied
+raw_schemas = {
+    "raw__log_data": [
+        ("artist", "artist", "string"),
+        ("auth", "auth", "string"),
+        ("first_name", "firstName", "string"),
+        ("gender", "gender", "string"),
+        ("item_in_session", "itemInSession", "int32"),
+        ("last_name", "lastName", "string"),
+        ("length", "length", "double"),
+        ("level", "level", "string"),
+        ("location", "location", "string"),
+        ("method", "method", "string"),
+        ("page", "page", "string"),
+        ("registration", "registration", "double"),
+        ("session_id", "sessionId", "int64"),
+        ("song", "song", "string"),
+        ("status", "status", "int16"),
+        ("ts", "ts", "int64"),
+        ("user_agent", "userAgent", "string"),
+        ("user_id", "userId", "string"),
+    ],
+    "raw__song_data": [
+        ("artist_id", "artist_id", "string"),
+        ("artist_latitude", "artist_latitude", "double"),
+        ("artist_location", "artist_location", "string"),
+        ("artist_longitude", "artist_longitude", "double"),
+        ("artist_name", "artist_name", "string"),
+        ("duration", "duration", "double"),
+        ("num_songs", "num_songs", "int16"),
+        ("song_id", "song_id", "string"),
+        ("title", "title", "string"),
+        ("year", "year", "int16"),
+    ],
+}
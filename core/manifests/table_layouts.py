@@ -0,0 +1,15 @@
+# join and filter patterns of the star schema, used to plan the distribution
+# and sort keys of its tables; each dimension is joined to the fact table on
+# a column of the same name
+star_schema = {
+    "fact": "fact_songplays",
+    "joins": {
+        "dim_artists": "artist_id",
+        "dim_songs": "song_id",
+        "dim_time": "time_id",
+        "dim_users": "user_id",
+    },
+    "filters": {
+        "fact_songplays": ("time_id",),
+    },
+}
@@ -0,0 +1,208 @@
+import decimal
+import io
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.json
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# postgresql type oids returned in cursor.description
+INTEGER_TYPES = {20: 'int64', 21: 'int16', 23: 'int32'}
+FLOAT_TYPES = {700, 701, 1700}
+BOOLEAN_TYPES = {16}
+TIMESTAMP_TYPES = {1114, 1184}
+DATE_TYPES = {1082}
+
+
+def transpose(rows, width):
+    """
+    Transpose a list of records into a list of columns.
+
+    Args:
+        rows (list): Records as returned by a cursor.
+
+        width (int): Number of columns in each record.
+
+    Returns:
+        list
+    """
+    if not rows:
+        return [[] for _ in range(width)]
+
+    return [list(column) for column in zip(*rows)]
+
+
+def to_numpy(names, type_codes, columns):
+    """
+    Convert columns of Python values into a dictionary of NumPy arrays, one
+    per column. Integer columns containing NULLs become masked arrays and
+    NUMERIC columns are converted to float64.
+
+    Args:
+        names (list): Column names.
+
+        type_codes (list): PostgreSQL type oids of the columns.
+
+        columns (list): Lists of column values.
+
+    Returns:
+        dict
+    """
+    if numpy is None:
+        raise ImportError('numpy is required for the numpy result format')
+
+    arrays = {}
+
+    for name, type_code, values in zip(names, type_codes, columns):
+        if type_code in INTEGER_TYPES:
+            mask = [x is None for x in values]
+            data = numpy.array(
+                [0 if x is None else x for x in values],
+                dtype=INTEGER_TYPES[type_code],
+            )
+            if any(mask):
+                data = numpy.ma.masked_array(data, mask=mask)
+            arrays[name] = data
+        elif type_code in FLOAT_TYPES:
+            arrays[name] = numpy.array(
+                [numpy.nan if x is None else float(x) for x in values],
+                dtype='float64',
+            )
+        elif type_code in BOOLEAN_TYPES:
+            dtype = object if None in values else bool
+            arrays[name] = numpy.array(values, dtype=dtype)
+        elif type_code in TIMESTAMP_TYPES:
+            arrays[name] = numpy.array(values, dtype='datetime64[us]')
+        elif type_code in DATE_TYPES:
+            arrays[name] = numpy.array(values, dtype='datetime64[D]')
+        else:
+            arrays[name] = numpy.array(values, dtype=object)
+
+    return arrays
+
+
+def arrow_type(type_code):
+    """
+    Return the Arrow type of a PostgreSQL type oid.
+
+    Args:
+        type_code (int): PostgreSQL type oid.
+
+    Returns:
+        pyarrow.DataType
+    """
+    if type_code in INTEGER_TYPES:
+        return getattr(pyarrow, INTEGER_TYPES[type_code])()
+    if type_code in FLOAT_TYPES:
+        return pyarrow.float64()
+    if type_code in BOOLEAN_TYPES:
+        return pyarrow.bool_()
+    if type_code in TIMESTAMP_TYPES:
+        return pyarrow.timestamp('us')
+    if type_code in DATE_TYPES:
+        return pyarrow.date32()
+
+    return pyarrow.string()
+
+
+def to_arrow(names, type_codes, columns):
+    """
+    Convert columns of Python values into an Arrow record batch.
+
+    Args:
+        names (list): Column names.
+
+        type_codes (list): PostgreSQL type oids of the columns.
+
+        columns (list): Lists of column values.
+
+    Returns:
+        pyarrow.RecordBatch
+    """
+    if pyarrow is None:
+        raise ImportError('pyarrow is required for the arrow result format')
+
+    arrays = []
+
+    for type_code, values in zip(type_codes, columns):
+        if type_code in FLOAT_TYPES:
+            values = [
+                float(x) if isinstance(x, decimal.Decimal) else x
+                for x in values
+            ]
+        elif type_code not in INTEGER_TYPES and type_code not in (
+                TIMESTAMP_TYPES | DATE_TYPES | BOOLEAN_TYPES):
+            values = [
+                x if x is None or isinstance(x, str) else str(x)
+                for x in values
+            ]
+        arrays.append(pyarrow.array(values, type=arrow_type(type_code)))
+
+    return pyarrow.RecordBatch.from_arrays(arrays, names=list(names))
+
+
+def json_to_arrow(data, columns):
+    """
+    Parse newline delimited JSON into an Arrow table with the given columns.
+    The JSON is parsed by the vectorised Arrow reader, fields are renamed to
+    their column names and cast to their declared types. Missing fields are
+    filled with NULLs and empty strings become NULL, as with the EMPTYASNULL
+    and BLANKSASNULL options of a JSON COPY.
+
+    Args:
+        data (bytes): Newline delimited JSON records.
+
+        columns (list): Tuples of column name, JSON field and Arrow type.
+
+    Returns:
+        pyarrow.Table
+    """
+    if pyarrow is None:
+        raise ImportError('pyarrow is required for the parquet format')
+
+    source = pyarrow.json.read_json(io.BytesIO(data))
+    arrays = []
+
+    for name, field, type_alias in columns:
+        target = pyarrow.type_for_alias(type_alias)
+
+        if field not in source.column_names:
+            arrays.append(pyarrow.nulls(source.num_rows, type=target))
+            continue
+
+        values = source.column(field)
+
+        if pyarrow.types.is_string(values.type):
+            blank = pyarrow.compute.equal(
+                pyarrow.compute.utf8_trim_whitespace(values), ''
+            )
+            values = pyarrow.compute.if_else(blank, None, values)
+
+        arrays.append(values.cast(target))
+
+    return pyarrow.table(arrays, names=[x[0] for x in columns])
+
+
+def to_parquet(table):
+    """
+    Serialise an Arrow table to Parquet bytes.
+
+    Args:
+        table (pyarrow.Table): The table to serialise.
+
+    Returns:
+        bytes
+    """
+    buffer = io.BytesIO()
+    pyarrow.parquet.write_table(table, buffer, compression='snappy')
+
+    return buffer.getvalue()
@@ -1,16 +1,25 @@
 import boto3
 import json
+import urllib.parse
 
-from core.logger import log
+from core.logger import (
+    log,
+    metrics,
+)
+from core.operators.s3 import split_s3_path
 from settings.aws_policies import (
     REDSHIFT_TRUST_RELATIONSHIP,
+    S3_EXPORT_POLICY_NAME,
     S3_READ_ACCESS,
+    s3_export_policy,
 )
 from settings.envs import (
     AWS_DB_ROLE,
+    AWS_ROLE_MODE,
     AWS_KEY,
     AWS_REGION,
     AWS_SECRET,
+    S3_EXPORT_DATAPATH,
 )
 
 logger = log.setup_custom_logger(__name__)
@@ -18,14 +27,21 @@ logger = log.setup_custom_logger(__name__)
 
 class IAMOperator:
 
-    def __init__(self):
+    def __init__(self, client=None):
 
         self._dwh_role_arn = None
         self._dwh_role_id = None
         self.aws_role_policies = [S3_READ_ACCESS]
+        self.aws_inline_policies = {}
+        if S3_EXPORT_DATAPATH:
+            # the cluster writes exports of the dimensional model to s3
+            self.aws_inline_policies[S3_EXPORT_POLICY_NAME] = (
+                s3_export_policy(*split_s3_path(S3_EXPORT_DATAPATH))
+            )
         self.dwh_db_role = AWS_DB_ROLE
         self.dwh_trust_policy = REDSHIFT_TRUST_RELATIONSHIP
-        self.client = self.create_iam_client()
+        self.role_mode = AWS_ROLE_MODE
+        self.client = client or self.create_iam_client()
 
     @property
     def user_info(self):
@@ -37,6 +53,11 @@ class IAMOperator:
 
         return self._dwh_role_arn
 
+    @dwh_role_arn.setter
+    def dwh_role_arn(self, arn):
+
+        self._dwh_role_arn = arn
+
     def create_iam_client(self):
         """
         Creates an IAM client with the AWS credentials in the application's
@@ -55,7 +76,7 @@ class IAMOperator:
 
         logger.info('Client created')
 
-        return client
+        return metrics.instrument_client(client)
 
     def create_role(self):
         """
@@ -66,13 +87,11 @@ class IAMOperator:
         Returns:
             json
         """
-        dwh_roles = self.client.list_roles()
-        role_list = {x['RoleName'] for x in dwh_roles['Roles']}
         role_text = (
             'Allows Redshift clusters to call AWS services on your behalf.'
         )
 
-        if self.dwh_db_role in role_list:
+        if self.find_role() is not None:
             self.detach_role_policies()
             self.delete_dwh_role()
 
@@ -95,6 +114,212 @@ class IAMOperator:
 
         return response
 
+    def find_role(self):
+        """
+        Return the data warehouse role from a paginated listing of the
+        account's roles, or None if it does not exist.
+
+        Returns:
+            json
+        """
+        paginator = self.client.get_paginator('list_roles')
+
+        for page in paginator.paginate():
+            for role in page['Roles']:
+                if role['RoleName'] == self.dwh_db_role:
+                    return role
+
+        return None
+
+    def list_attached_policies(self):
+        """
+        Return the ARNs of the managed policies attached to the data warehouse
+        role.
+
+        Returns:
+            set
+        """
+        paginator = self.client.get_paginator('list_attached_role_policies')
+        arns = set()
+
+        for page in paginator.paginate(RoleName=self.dwh_db_role):
+            for policy in page['AttachedPolicies']:
+                arns.add(policy['PolicyArn'])
+
+        return arns
+
+    def reconcile_role(self):
+        """
+        Brings the data warehouse role in line with the trust policy and
+        policy list of this class, making only the API calls needed to close
+        the difference. An existing role is kept, so Redshift does not have to
+        wait for a new role to propagate. The number of calls saved compared
+        to deleting and recreating the role is logged; the get_role_policy
+        call made to compare each inline policy counts against the saving,
+        since recreating the role does not need it.
+
+        Returns:
+            int: The number of API calls saved.
+        """
+        desired = {policy['arn'] for policy in self.aws_role_policies}
+        role = self.find_role()
+
+        if role is None:
+            self.create_role()
+            self.attach_role_policies()
+            return 0
+
+        calls = 0
+        trust_policy = role['AssumeRolePolicyDocument']
+
+        if isinstance(trust_policy, str):
+            trust_policy = json.loads(urllib.parse.unquote(trust_policy))
+
+        if (json.dumps(trust_policy, sort_keys=True)
+                != json.dumps(self.dwh_trust_policy, sort_keys=True)):
+            self.client.update_assume_role_policy(
+                RoleName=self.dwh_db_role,
+                PolicyDocument=json.dumps(self.dwh_trust_policy),
+            )
+            calls += 1
+            logger.info(f"Trust policy of '{self.dwh_db_role}' updated")
+
+        attached = self.list_attached_policies()
+
+        for arn in desired - attached:
+            self.client.attach_role_policy(
+                RoleName=self.dwh_db_role,
+                PolicyArn=arn,
+            )
+            calls += 1
+            logger.info(f"'{arn}' added to '{self.dwh_db_role}'")
+
+        for arn in attached - desired:
+            self.client.detach_role_policy(
+                RoleName=self.dwh_db_role,
+                PolicyArn=arn,
+            )
+            calls += 1
+            logger.info(f"'{arn}' detached from '{self.dwh_db_role}'")
+
+        inline = self.list_inline_policies()
+        # one get_role_policy call per inline policy
+        reads = len(inline)
+
+        for name, document in self.aws_inline_policies.items():
+            if inline.get(name) == document:
+                continue
+            self.put_inline_policy(name=name, document=document)
+            calls += 1
+
+        for name in inline.keys() - self.aws_inline_policies.keys():
+            self.delete_inline_policy(name=name)
+            calls += 1
+
+        self._dwh_role_id = role['RoleId']
+        self._dwh_role_arn = role['Arn']
+
+        # detach, delete, create, attach and put calls made by create_role()
+        recreate_calls = (
+            len(attached) + len(inline) + 1 + 1 + len(desired)
+            + len(self.aws_inline_policies)
+        )
+        saved = recreate_calls - calls - reads
+
+        logger.info(
+            f"'{self.dwh_db_role}' reconciled with {calls} changes and "
+            f"{reads} inline policy reads, {saved} API calls saved"
+        )
+
+        return saved
+
+    def list_inline_policies(self):
+        """
+        Return the inline policies of the data warehouse role.
+
+        Returns:
+            dict: Policy name mapped to its policy document.
+        """
+        paginator = self.client.get_paginator('list_role_policies')
+        policies = {}
+
+        for page in paginator.paginate(RoleName=self.dwh_db_role):
+            for name in page['PolicyNames']:
+                document = self.client.get_role_policy(
+                    RoleName=self.dwh_db_role,
+                    PolicyName=name,
+                )['PolicyDocument']
+                if isinstance(document, str):
+                    document = json.loads(urllib.parse.unquote(document))
+                policies[name] = document
+
+        return policies
+
+    def put_inline_policy(self, name, document):
+        """
+        Add an inline policy to the data warehouse role, or replace it.
+        Inline policies grant access scoped to the resources of this
+        application, such as the S3 export prefix.
+
+        Args:
+            name (string): Name of the policy.
+
+            document (dict): The policy document.
+
+        Returns:
+            json
+        """
+        response = self.client.put_role_policy(
+            RoleName=self.dwh_db_role,
+            PolicyName=name,
+            PolicyDocument=json.dumps(document),
+        )
+
+        logger.info(f"'{name}' added to '{self.dwh_db_role}'")
+
+        return response
+
+    def delete_inline_policy(self, name):
+        """
+        Delete an inline policy from the data warehouse role.
+
+        Args:
+            name (string): Name of the policy.
+
+        Returns:
+            None
+        """
+        try:
+            self.client.delete_role_policy(
+                RoleName=self.dwh_db_role,
+                PolicyName=name,
+            )
+        except self.client.exceptions.NoSuchEntityException:
+            logger.info(f"'{name}' already deleted!")
+            return
+
+        logger.info(f"'{name}' deleted from '{self.dwh_db_role}'")
+
+    def get_role(self):
+        """
+        Return the data warehouse role if it exists and assign its ARN as a
+        property of this class, otherwise return None.
+
+        Returns:
+            json
+        """
+        try:
+            response = self.client.get_role(RoleName=self.dwh_db_role)
+        except self.client.exceptions.NoSuchEntityException:
+            return None
+
+        self._dwh_role_id = response['Role']['RoleId']
+        self._dwh_role_arn = response['Role']['Arn']
+
+        logger.info(f"'{self.dwh_db_role}' found")
+
+        return response
+
     def attach_role_policies(self):
         """
         Attaches a list of policies to the AWS role created by the application.
@@ -123,6 +348,11 @@ class IAMOperator:
                 f"""'{policy["name"]}' added to '{self.dwh_db_role}'"""
             )
 
+        for name, document in self.aws_inline_policies.items():
+            responses.append(
+                self.put_inline_policy(name=name, document=document)
+            )
+
         return responses
 
     def detach_role_policies(self):
@@ -148,6 +378,9 @@ class IAMOperator:
             logger.info(f"'{policy['name']}' detached")
             responses.append(response)
 
+        for name in self.list_inline_policies():
+            self.delete_inline_policy(name=name)
+
         return responses
 
     def delete_dwh_role(self):
@@ -173,9 +406,10 @@ class IAMOperator:
 
     def teardown(self):
         """
-        Detaches the policies from the application's data warehouse role then
-        deletes it. This function is executed when the application is in
-        `dry_run` mode; the AWS infrastructure is torn down upon completion.
+        Detaches the policies from the application's data warehouse role,
+        deletes its inline policies, then deletes it. This function is
+        executed when the application is in `dry_run` mode; the AWS
+        infrastructure is torn down upon completion.
 
         Returns:
             None
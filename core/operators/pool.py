@@ -0,0 +1,175 @@
+import collections
+import contextlib
+import psycopg2
+import threading
+import time
+
+from core.logger import log
+from core.queries.sql import set_session_parameter
+
+logger = log.setup_custom_logger(__name__)
+
+
+class ConnectionPool:
+
+    def __init__(self, connect_kwargs, minconn=1, maxconn=4,
+                 autocommit=False, session_parameters=None,
+                 healthcheck_idle=30):
+
+        self.connect_kwargs = connect_kwargs
+        self.minconn = minconn
+        self.maxconn = max(minconn, maxconn)
+        self.autocommit = autocommit
+        self.session_parameters = session_parameters or {}
+        self.healthcheck_idle = healthcheck_idle
+        self.idle = collections.deque()
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.maxconn)
+        self.reconnects = 0
+
+        for _ in range(self.minconn):
+            self.idle.append((self.connect(), time.monotonic()))
+
+    def connect(self):
+        """
+        Open a new database connection with the pool's auto-commit setting and
+        apply the session parameters, such as query_group, statement_timeout
+        and search_path, to it.
+
+        Returns:
+            psycopg2.extensions.connection
+        """
+        conn = psycopg2.connect(**self.connect_kwargs)
+        conn.set_session(autocommit=self.autocommit)
+
+        with conn.cursor() as cur:
+            for name, value in self.session_parameters.items():
+                if value in (None, '', []):
+                    continue
+                cur.execute(set_session_parameter(name=name, value=value))
+        conn.commit()
+
+        logger.debug(
+            f"Connected to host: {self.connect_kwargs.get('host')}"
+            f", database: {self.connect_kwargs.get('dbname')}"
+        )
+
+        return conn
+
+    def is_alive(self, conn, last_used):
+        """
+        Return True if an idle connection can still be used. Connections which
+        have been idle for longer than `healthcheck_idle` seconds are checked
+        with a trivial query, since the cluster may have dropped them.
+
+        Args:
+            conn (psycopg2.extensions.connection): An idle connection.
+
+            last_used (float): Monotonic time the connection was returned.
+
+        Returns:
+            bool
+        """
+        if conn.closed:
+            return False
+
+        if time.monotonic() - last_used < self.healthcheck_idle:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1;')
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+
+        return True
+
+    def discard(self, conn):
+
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def checkout(self):
+        """
+        Borrow a healthy connection from the pool, blocking while `maxconn`
+        connections are in use. Dead connections are discarded and replaced
+        with a new connection to the cluster.
+
+        Returns:
+            psycopg2.extensions.connection
+        """
+        self.slots.acquire()
+
+        try:
+            while True:
+                with self.lock:
+                    item = self.idle.pop() if self.idle else None
+
+                if item is None:
+                    return self.connect()
+
+                conn, last_used = item
+                if self.is_alive(conn, last_used):
+                    return conn
+
+                logger.info('Dropped connection discarded, reconnecting')
+                self.discard(conn)
+                self.reconnects += 1
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def checkin(self, conn):
+        """
+        Return a borrowed connection to the pool. Any open transaction is
+        rolled back; broken connections are closed instead of being reused.
+
+        Args:
+            conn (psycopg2.extensions.connection): The borrowed connection.
+
+        Returns:
+            None
+        """
+        try:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    self.discard(conn)
+
+            if not conn.closed:
+                with self.lock:
+                    self.idle.append((conn, time.monotonic()))
+        finally:
+            self.slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Context manager which borrows a connection for the duration of a
+        `with` block.
+
+        Returns:
+            psycopg2.extensions.connection
+        """
+        conn = self.checkout()
+
+        try:
+            yield conn
+        finally:
+            self.checkin(conn)
+
+    def closeall(self):
+        """
+        Close every idle connection in the pool.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            while self.idle:
+                conn, _ = self.idle.pop()
+                self.discard(conn)
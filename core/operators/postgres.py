@@ -1,12 +1,57 @@
+import contextlib
 import logging
 import psycopg2
+import threading
 import time
+import uuid
 
-import core.logger.log as log
-
+from core.etl.plans import (
+    is_explainable,
+    split_statements,
+)
+from core.etl.scheduler import (
+    TaskScheduler,
+    task_name,
+)
+from core.logger import (
+    log,
+    metrics,
+)
+from core.operators.columnar import (
+    to_arrow,
+    to_numpy,
+    transpose,
+)
+from core.operators.pool import ConnectionPool
 from core.queries.sql import (
+    alter_table_diststyle,
+    alter_table_sortkey,
+    analyze_columns,
+    analyze_compression,
+    column_blocks,
+    copy_analysis,
+    copy_json_from_s3,
+    count_slices,
+    create_table_etl_run_state,
+    deep_copy_table,
     drop_table,
+    explain,
+    get_watermark,
+    identity_columns,
+    insert_columns,
+    last_copy,
+    list_columns,
     list_tables,
+    load_commits,
+    load_errors,
+    query_stats,
+    record_run_state,
+    reset_session_parameter,
+    set_session_parameter,
+    set_watermark,
+    table_info,
+    truncate_table,
+    vacuum_table,
 )
 from settings.envs import (
     AWS_REGION,
@@ -16,18 +61,36 @@ from settings.envs import (
     DWH_DB_USER,
     DWH_DB_PUBLIC_VAULT,
     DWH_DB_RAW_VAULT,
+    DWH_LOAD_PROFILE,
+    DWH_POOL_HEALTHCHECK_IDLE,
+    DWH_POOL_MAX,
+    DWH_POOL_MIN,
+    DWH_QUERY_GROUP,
+    DWH_SEARCH_PATH,
+    DWH_STATEMENT_TIMEOUT,
+    DWH_STREAM_ITERSIZE,
 )
 
 logger = log.setup_custom_logger(__name__)
 
+# control tables which survive a full reload
+CONTROL_TABLES = ('etl_run_state',)
+
 
 class PostgreSQLOperator:
 
     def __init__(self):
 
         self.aws_region = AWS_REGION
-        self.cur = None
-        self.conn = None
+        self.pool = None
+        self.endpoint = None
+        self.local = threading.local()
+        self.query_label = None
+        self.session_parameters = {
+            'query_group': DWH_QUERY_GROUP,
+            'statement_timeout': DWH_STATEMENT_TIMEOUT,
+            'search_path': DWH_SEARCH_PATH,
+        }
         self.dwh_db_name = DWH_DB_NAME
         self.dwh_db_port = DWH_DB_PORT
         self.dwh_db_user = DWH_DB_USER
@@ -38,11 +101,14 @@ class PostgreSQLOperator:
 
         return self.get_tables()
 
-    def create_connection(self, endpoint, autocommit=False):
+    def create_connection(self, endpoint, autocommit=False, minconn=None,
+                          maxconn=None):
         """
-        Create connection to database endpoint with specified auto-commit
-        settings. On connection, a cursor and connection object are attached
-        as properties to this class.
+        Create a pool of connections to the database endpoint with specified
+        auto-commit settings. The pool is attached as a property to this
+        class; every query borrows a connection from it, so that independent
+        tasks can be executed at the same time. Connections are checked for
+        liveness on checkout and reopened if the cluster has dropped them.
 
         Args:
             endpoint (string): Endpoint of Redshift cluster to be accessed by
@@ -52,6 +118,10 @@ class PostgreSQLOperator:
             autocommit (boolean): Whether database changes should be committed
             automatically or not, this application uses manual commits.
 
+            minconn (int): Number of connections opened up front.
+
+            maxconn (int): Maximum number of connections open at once.
+
         Returns:
             None
         """
@@ -63,22 +133,153 @@ class PostgreSQLOperator:
             'user': self.dwh_db_user,
         }
         try:
-            self.conn = psycopg2.connect(**envs)
+            self.pool = ConnectionPool(
+                connect_kwargs=envs,
+                minconn=minconn or DWH_POOL_MIN,
+                maxconn=maxconn or DWH_POOL_MAX,
+                autocommit=autocommit,
+                session_parameters=self.session_parameters,
+                healthcheck_idle=DWH_POOL_HEALTHCHECK_IDLE,
+            )
         except psycopg2.Error as e:
             raise e
 
-        self.conn.set_session(autocommit=autocommit)
-        self.cur = self.conn.cursor()
+        self.endpoint = endpoint
 
         logger.debug(
-            f"Connected to host: {envs.get('host')}"
+            f"Connection pool created for host: {envs.get('host')}"
             f", database: {envs.get('dbname')}"
         )
 
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Context manager which pins a pooled connection to the current thread
+        for the duration of a `with` block. Queries executed inside the block
+        share the connection, which is needed for session-scoped state such
+        as pg_last_copy_count(). Nested blocks reuse the pinned connection.
+
+        While `query_label` is set, the queries of the block run under it as
+        their query_group, so that they can be found in the system tables.
+
+        Returns:
+            psycopg2.extensions.connection
+        """
+        conn = getattr(self.local, 'conn', None)
+
+        if conn is not None:
+            yield conn
+            return
+
+        label = self.query_label
+
+        with self.pool.connection() as conn:
+            self.local.conn = conn
+            try:
+                if label:
+                    self.set_query_group(conn=conn, label=label)
+                yield conn
+            finally:
+                if label:
+                    self.set_query_group(conn=conn, label=None)
+                self.local.conn = None
+
+    @contextlib.contextmanager
+    def labelled(self, task):
+        """
+        Context manager which pins a session, like session(), and runs the
+        queries of a manifest task under its own query_group label, made of
+        `query_label` and the name of the task. Nothing is labelled while
+        `query_label` is not set.
+
+        Args:
+            task (dict): A manifest task.
+
+        Returns:
+            psycopg2.extensions.connection
+        """
+        with self.session() as conn:
+            label = self.query_label
+
+            if not label:
+                yield conn
+                return
+
+            self.set_query_group(conn=conn, label=f'{label}:{task_name(task)}')
+            try:
+                yield conn
+            finally:
+                self.set_query_group(conn=conn, label=label)
+
+    def set_query_group(self, conn, label):
+        """
+        Set the query_group of a connection, which Redshift records as the
+        label of each query in stl_query. The configured DWH_QUERY_GROUP is
+        restored when the label is None. A failed transaction is rolled back
+        first, since no statement can run in it.
+
+        Args:
+            conn (psycopg2.extensions.connection): A pinned connection.
+
+            label (string): The query_group label, at most 320 characters.
+
+        Returns:
+            None
+        """
+        if conn.closed:
+            return
+
+        status = conn.get_transaction_status()
+        if status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            conn.rollback()
+
+        label = label or DWH_QUERY_GROUP
+
+        if label:
+            query = set_session_parameter(name='query_group', value=label)
+        else:
+            query = reset_session_parameter(name='query_group')
+
+        with conn.cursor() as cur:
+            cur.execute(query)
+        conn.commit()
+
+    def get_query_stats(self, label):
+        """
+        Collect the statistics of the queries labelled with the query_group
+        `label`, or with the label of one of its tasks, '<label>:<task>',
+        from the stl_query, stl_wlm_query, svl_query_summary and
+        stl_load_commits system tables, summed per label. Times are in
+        seconds.
+
+        Args:
+            label (string): The label of a stage, '<run_id>:<stage>'.
+
+        Returns:
+            list: A dictionary for each label.
+        """
+        fields = (
+            'label', 'queries', 'aborted', 'elapsed_secs', 'queue_secs',
+            'exec_secs', 'rows_scanned', 'bytes_scanned', 'spilled_steps',
+            'files_loaded', 'lines_loaded',
+        )
+        rows = self.execute_query(query=query_stats(label=label)) or []
+
+        def convert(field, value):
+            if field == 'label':
+                return value
+            return float(value) if field.endswith('_secs') else int(value)
+
+        return [
+            {field: convert(field, value) for field, value in zip(fields, row)}
+            for row in rows
+        ]
+
     def execute_query(self, query, *args):
         """
         Execute a single SQL query with specified parameters. A None object is
-        returned if the query does not retrieve records.
+        returned if the query does not retrieve records. All of the records
+        are fetched into memory; use stream_query() for large results.
 
         Args:
             query (string): The SQL query to execute.
@@ -90,19 +291,215 @@ class PostgreSQLOperator:
         Returns:
             tuple
         """
-        try:
-            self.cur.execute(query=query, vars=args)
-            self.conn.commit()
-        except psycopg2.Error as e:
-            raise e
+        with self.session() as conn:
+            with conn.cursor() as cur:
+                start_time = time.perf_counter()
+                try:
+                    cur.execute(query=query, vars=args)
+                    conn.commit()
+                except psycopg2.Error as e:
+                    raise e
+                self.observe_statement(cur, start_time)
 
-        try:
-            result = self.cur.fetchall()
-        except psycopg2.ProgrammingError:
-            return None
+                if cur.description is None:
+                    logger.debug(f'{cur.rowcount} rows affected')
+                    return None
+
+                result = cur.fetchall()
 
         return result
 
+    def execute_statement(self, query, *args):
+        """
+        Execute a single SQL statement which does not return records, such as
+        an INSERT or DELETE, and return the number of rows it affected.
+
+        Args:
+            query (string): The SQL statement to execute.
+
+            args (tuple): Arguments to pass to a string formatted SQL query.
+
+        Returns:
+            int
+        """
+        with self.session() as conn:
+            with conn.cursor() as cur:
+                start_time = time.perf_counter()
+                cur.execute(query=query, vars=args)
+                conn.commit()
+                self.observe_statement(cur, start_time)
+
+                return cur.rowcount
+
+    def execute_autocommit(self, query, *args):
+        """
+        Execute a single SQL statement outside of a transaction block. This
+        is required by statements such as VACUUM, which Redshift refuses to
+        run inside a transaction.
+
+        Args:
+            query (string): The SQL statement to execute.
+
+            args (tuple): Arguments to pass to a string formatted SQL query.
+
+        Returns:
+            None
+        """
+        with self.session() as conn:
+            autocommit = conn.autocommit
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    start_time = time.perf_counter()
+                    cur.execute(query=query, vars=args)
+                    self.observe_statement(cur, start_time)
+            finally:
+                conn.autocommit = autocommit
+
+    def observe_statement(self, cur, start_time):
+        """
+        Record the duration of the statement last executed by a cursor as
+        dwh_sql_statement_seconds, labelled with its leading keyword, such
+        as SELECT, INSERT or COPY.
+
+        Args:
+            cur (psycopg2.extensions.cursor): The cursor.
+
+            start_time (float): perf_counter() value taken before the
+            statement was executed.
+
+        Returns:
+            None
+        """
+        words = (cur.query or b'').split(None, 1)
+        statement = words[0].decode().upper() if words else 'UNKNOWN'
+
+        metrics.observe(
+            'sql_statement_seconds',
+            time.perf_counter() - start_time,
+            statement=statement,
+        )
+
+    def render(self, query):
+        """
+        Return the text of a composed SQL query as it would be sent to the
+        cluster.
+
+        Args:
+            query (psycopg2.sql.Composable): The SQL query to render.
+
+        Returns:
+            string
+        """
+        with self.session() as conn:
+            return query.as_string(conn)
+
+    def stream_query(self, query, itersize=None, batch_size=None):
+        """
+        Execute a SELECT query with a named, server-side cursor and yield its
+        records as they are fetched, so that large results, such as extracts
+        of fact_songplays, are never held in client memory all at once. The
+        cursor fetches `itersize` records per round trip.
+
+        The generator borrows its own connection from the pool for as long
+        as it is being consumed; close the generator to release it early.
+
+        Args:
+            query (string): The SELECT query to execute.
+
+            itersize (int): Number of records fetched per round trip.
+
+            batch_size (int): If given, lists of up to `batch_size` records
+            are yielded instead of single records.
+
+        Returns:
+            generator
+        """
+        rows = 0
+
+        with self.server_cursor(query=query, itersize=itersize) as cur:
+            if batch_size:
+                while True:
+                    batch = cur.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    rows += len(batch)
+                    yield batch
+            else:
+                for row in cur:
+                    rows += 1
+                    yield row
+
+        logger.debug(f'{rows} rows streamed')
+
+    def stream_columns(self, query, chunk_size=None, result_format='arrow'):
+        """
+        Execute a SELECT query with a server-side cursor and yield its result
+        in column-oriented chunks of up to `chunk_size` records, either as
+        Arrow record batches or as dictionaries of NumPy arrays. Redshift
+        cannot COPY a result to STDOUT, so the records are decoded from the
+        cursor one chunk at a time and transposed into typed column buffers,
+        which hold far less memory per value than lists of tuples.
+
+        Args:
+            query (string): The SELECT query to execute.
+
+            chunk_size (int): Number of records per chunk.
+
+            result_format (string): 'arrow' for pyarrow.RecordBatch chunks or
+            'numpy' for dictionaries of numpy arrays.
+
+        Returns:
+            generator
+        """
+        convert = {'arrow': to_arrow, 'numpy': to_numpy}[result_format]
+        chunk_size = chunk_size or DWH_STREAM_ITERSIZE
+
+        with self.server_cursor(query=query, itersize=chunk_size) as cur:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+
+                names = [column.name for column in cur.description]
+                type_codes = [column.type_code for column in cur.description]
+
+                yield convert(
+                    names=names,
+                    type_codes=type_codes,
+                    columns=transpose(rows=rows, width=len(names)),
+                )
+
+    @contextlib.contextmanager
+    def server_cursor(self, query, itersize=None):
+        """
+        Context manager which executes a query with a named, server-side
+        cursor on its own pooled connection. The cursor is closed and the
+        read transaction ended when the block exits.
+
+        Args:
+            query (string): The SELECT query to execute.
+
+            itersize (int): Number of records fetched per round trip.
+
+        Returns:
+            psycopg2.extensions.cursor
+        """
+        with self.pool.connection() as conn:
+            cur = conn.cursor(name=f'stream_{uuid.uuid4().hex}')
+            cur.itersize = itersize or DWH_STREAM_ITERSIZE
+
+            try:
+                cur.execute(query)
+                yield cur
+            finally:
+                # the pool rolls back the connection if closing fails
+                try:
+                    cur.close()
+                    conn.commit()
+                except psycopg2.Error:
+                    pass
+
     def get_tables(self):
         """
         Execute a SQL query to return a list of all tables in the database.
@@ -137,48 +534,363 @@ class PostgreSQLOperator:
 
             logger.info(f"Data warehouse vault '{schema}' created")
 
-    def execute_tasks(self, manifest):
+    def execute_tasks(self, manifest, concurrency=1, on_complete=None,
+                      plans=None):
         """
         Execute a set of commands contained within a task in a manifest. A
         task is a dictionary containing the details of a database operation,
         this application uses these to carry out operations, such as creating
         tables or transforming data before loading to the dimensional model.
 
+        When concurrency is greater than 1, tasks that do not depend on each
+        other are executed at the same time, each on its own connection to
+        the cluster. Dependencies are inferred from the `raw_table` and
+        `public_table` keys of each task or declared in its `depends_on` key.
+
         Args:
             manifest (list): A manifest is a list, of dictionary objects
             containing the details of a task. These keyword arguments are
             passed to the task's parametrised SQL query which this function
             executes.
 
+            concurrency (int): The maximum number of tasks to execute at the
+            same time.
+
+            on_complete (callable): Optional callback invoked with each task
+            once it has completed, used to checkpoint the run.
+
+            plans (PlanCapture): Optional store for the query plans of the
+            tasks, see execute_task().
+
         Returns:
             None
         """
-        for task in manifest:
-            query = task['query']
-            self.execute_query(query=query(**task))
+        if concurrency <= 1:
+            for task in manifest:
+                self.execute_task(task=task, plans=plans)
 
-            logger.info(
-                f"Data warehouse task '{task['query'].__name__}' completed"
-            )
+                logger.info(
+                    f"Data warehouse task '{task['query'].__name__}' "
+                    f"completed"
+                )
+
+                if on_complete:
+                    on_complete(task)
+            return
 
-    def drop_tables(self):
+        scheduler = TaskScheduler(max_workers=concurrency)
+        scheduler.run(
+            manifest=manifest,
+            func=lambda task: self.execute_isolated_task(
+                task, on_complete, plans
+            ),
+        )
+
+    def execute_task(self, task, plans=None):
+        """
+        Execute the SQL query of a manifest task. When a plan store is given,
+        the query is split into its statements, which are executed one at a
+        time in a single transaction; each statement is explained right
+        before it runs, once the temporary tables it reads exist, and its
+        plan is recorded.
+
+        Args:
+            task (dict): A manifest task.
+
+            plans (PlanCapture): Optional store for the query plans.
+
+        Returns:
+            None
+        """
+        query = task['query'](**task)
+
+        if plans is None:
+            with self.labelled(task):
+                self.execute_query(query=query)
+            return
+
+        statements = split_statements(self.render(query))
+
+        with self.labelled(task) as conn:
+            try:
+                with conn.cursor() as cur:
+                    for i, statement in enumerate(statements):
+                        if is_explainable(statement):
+                            cur.execute(explain(statement))
+                            plans.record(
+                                task=task_name(task),
+                                index=i,
+                                statement=statement,
+                                lines=[row[0] for row in cur.fetchall()],
+                            )
+                        start_time = time.perf_counter()
+                        cur.execute(statement)
+                        self.observe_statement(cur, start_time)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def execute_isolated_task(self, task, on_complete=None, plans=None):
+        """
+        Execute a single manifest task on its own pooled connection. This
+        method is invoked from the worker threads of the task scheduler, so
+        that independent tasks do not share a cursor.
+
+        Args:
+            task (dict): A manifest task.
+
+            on_complete (callable): Optional callback invoked with the task
+            once it has completed.
+
+            plans (PlanCapture): Optional store for the query plans.
+
+        Returns:
+            None
+        """
+        with self.session():
+            self.execute_task(task=task, plans=plans)
+
+        logger.info(
+            f"Data warehouse task '{task['query'].__name__}' completed"
+        )
+
+        if on_complete:
+            on_complete(task)
+
+    def drop_tables(self, keep=CONTROL_TABLES):
         """
         Iterate over all data warehouse tables and execute a DROP TABLE SQL
-        query.
+        query. The control tables holding the pipeline's run history are kept.
+
+        Args:
+            keep (tuple): Names of tables which should not be dropped.
 
         Returns:
             None
         """
-        for row in self.dwh_db_tables:
-            schema, table = row
-            self.execute_query(query=drop_table(schema=schema, table=table))
+        statements = [
+            drop_table(schema=schema, table=table)
+            for schema, table in self.dwh_db_tables
+            if table not in keep
+        ]
+
+        if statements:
+            self.execute_batch(statements=statements)
+
+        logger.info(f'{len(statements)} data warehouse tables dropped')
+
+    def execute_batch(self, statements, profile=False):
+        """
+        Execute a list of SQL statements, or the tasks of a manifest, in a
+        single transaction. By default the statements are sent to the cluster
+        in one round trip and committed once. If the batch fails, it is rolled
+        back and the statements are replayed one at a time, again rolled back,
+        to report which statement failed.
+
+        This method is intended for DDL, such as the create_tables manifest.
+        Statements which manage their own transactions, such as the
+        transform_data queries, must not be batched.
+
+        Args:
+            statements (list): Composed SQL statements, or manifest tasks
+            whose parametrised SQL queries are executed.
+
+            profile (bool): Set to True to send each statement separately,
+            still within one transaction, to time each statement.
+
+        Returns:
+            list: Tuples of statement label and seconds taken.
+        """
+        batch = []
+
+        for i, statement in enumerate(statements):
+            if isinstance(statement, dict):
+                batch.append(
+                    (task_name(statement), statement['query'](**statement))
+                )
+            else:
+                batch.append((f'statement {i}', statement))
+
+        timings = []
+        start_time = time.time()
+
+        with self.session() as conn:
+            with conn.cursor() as cur:
+                try:
+                    if profile:
+                        for label, statement in batch:
+                            statement_start = time.time()
+                            cur.execute(statement)
+                            secs = round(time.time() - statement_start, 3)
+                            timings.append((label, secs))
+                    else:
+                        cur.execute(
+                            '\n'.join(x.as_string(conn) for _, x in batch)
+                        )
+                        timings.append(
+                            ('batch', round(time.time() - start_time, 3))
+                        )
+                    conn.commit()
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    label = self.find_failing_statement(conn=conn, batch=batch)
+                    logger.error(f"Batch failed at '{label}': {e}")
+                    raise e
+
+        logger.info(
+            f'{len(batch)} statements executed in one transaction in '
+            f'{round(time.time() - start_time, 2)} secs'
+        )
+
+        return timings
+
+    def find_failing_statement(self, conn, batch):
+        """
+        Replay a failed batch one statement at a time inside a transaction
+        which is always rolled back, and return the label of the first
+        statement which fails.
+
+        Args:
+            conn (psycopg2.extensions.connection): The batch's connection.
+
+            batch (list): Tuples of statement label and composed SQL.
+
+        Returns:
+            string
+        """
+        with conn.cursor() as cur:
+            for label, statement in batch:
+                try:
+                    cur.execute(statement)
+                except psycopg2.Error:
+                    conn.rollback()
+                    return label
+
+        conn.rollback()
+
+        return None
+
+    def get_slice_count(self):
+        """
+        Return the number of slices in the Redshift cluster. Each slice loads
+        one input file at a time, so COPY inputs are staged as a multiple of
+        this number.
+
+        Returns:
+            int
+        """
+        slices = self.execute_query(query=count_slices())[0][0]
+
+        logger.info(f'Cluster has {slices} slices')
+
+        return slices
+
+    def truncate_table(self, schema, table):
+        """
+        Execute a TRUNCATE TABLE SQL query. Incremental runs truncate the raw
+        vault log table so that it only holds the newly loaded partitions.
+
+        Args:
+            schema (string): Schema of the table to truncate.
+
+            table (string): Name of the table to truncate.
+
+        Returns:
+            None
+        """
+        self.execute_query(query=truncate_table(schema=schema, table=table))
+
+        logger.info(f"Data warehouse table '{schema}.{table}' truncated")
+
+    def get_watermark(self, source):
+        """
+        Return the load watermark recorded for a raw vault source table. The
+        watermark is the S3 path of the last object loaded into the table.
+
+        Args:
+            source (string): Name of the raw vault table.
+
+        Returns:
+            string
+        """
+        result = self.execute_query(query=get_watermark(source=source))
+
+        if not result:
+            return None
+
+        watermark, max_ts = result[0]
+        logger.info(
+            f"Watermark of '{source}': {watermark} (max ts: {max_ts})"
+        )
 
-            logger.info(f"Data warehouse table '{schema}.{table}' dropped")
+        return watermark
 
-    def copy_s3_data(self, manifest, role_arn):
+    def set_watermark(self, source, watermark):
+        """
+        Record the load watermark of a raw vault source table, along with the
+        latest event timestamp it holds.
+
+        Args:
+            source (string): Name of the raw vault table.
+
+            watermark (string): S3 path of the last object loaded.
+
+        Returns:
+            None
+        """
+        self.execute_query(
+            query=set_watermark(source=source, watermark=watermark)
+        )
+
+        logger.info(f"Watermark of '{source}' set to {watermark}")
+
+    def create_run_state_table(self):
+        """
+        Create the control table which mirrors the pipeline's run state in
+        the raw vault.
+
+        Returns:
+            None
+        """
+        self.execute_query(query=create_table_etl_run_state())
+
+    def record_run_state(self, run_id, stage, fingerprint):
+        """
+        Record a completed pipeline stage or task in the run state control
+        table. Any earlier row of the same run and stage is replaced, so
+        that resumed runs do not mirror their stages twice.
+
+        Args:
+            run_id (string): Identifier of the current run.
+
+            stage (string): Name of the completed stage or task.
+
+            fingerprint (string): Fingerprint of the inputs it ran with.
+
+        Returns:
+            None
+        """
+        self.execute_query(
+            query=record_run_state(
+                run_id=run_id,
+                stage=stage,
+                fingerprint=fingerprint,
+            )
+        )
+
+    def copy_s3_data(self, manifest, role_arn, parallelism=1,
+                     on_complete=None):
         """
         Execute a SQL query to copy raw data from S3 to staging tables in the
-        Redshift cluster.
+        Redshift cluster. When parallelism is greater than 1, the COPY
+        commands are executed at the same time, each on its own connection.
+        A summary of the time taken, rows and files loaded per table is
+        logged once all of the tables have been copied.
+
+        With the 'fast' load profile the JSON COPYs skip statistics, so each
+        table they loaded is analyzed once, on the columns listed under the
+        `analyze` keys of its tasks, after every COPY has completed.
 
         Args:
             manifest (list): This application uses manifests, a manifest is a
@@ -190,34 +902,510 @@ class PostgreSQLOperator:
             cluster to read from S3, this is available as a property of the
             IAMOperator.
 
+            parallelism (int): The maximum number of COPY commands to execute
+            at the same time.
+
+            on_complete (callable): Optional callback invoked with each task
+            once its COPY has completed, used to checkpoint the run.
+
         Returns:
-            None
+            list
+        """
+        start_time = time.time()
+
+        if parallelism <= 1:
+            summary = []
+            for task in manifest:
+                summary.append(self.copy_table(task=task, role_arn=role_arn))
+                if on_complete:
+                    on_complete(task)
+        else:
+            def copy_task(task):
+                result = self.copy_isolated_table(task, role_arn)
+                if on_complete:
+                    on_complete(task)
+                return result
+
+            scheduler = TaskScheduler(max_workers=parallelism)
+            results = scheduler.run(manifest=manifest, func=copy_task)
+            summary = [results[task_name(task)] for task in manifest]
+
+        analyzed = self.analyze_copied_tables(manifest=manifest)
+
+        for row in summary:
+            # credit each table's ANALYZE to the first of its COPYs
+            row['analyze_secs'] = analyzed.pop(row['table'], 0.0)
+
+        end_time = round(time.time() - start_time, 2)
+        self.log_copy_summary(summary=summary, elapsed=end_time)
+
+        return summary
+
+    def copy_table(self, task, role_arn):
         """
+        Execute the COPY query of a single copy_data manifest task, then
+        collect the number of rows and files it loaded, and the last file in
+        key order, from the pg_last_copy_count() function and the
+        stl_load_commits system table, and the rows it rejected from the
+        stl_load_errors system table. These statistics are only visible to
+        the session which ran the COPY.
+
+        The time the COPY spent on compression analysis and statistics is
+        read from stl_query. The 'fast' load profile skips both.
+
+        Args:
+            task (dict): A copy_data manifest task.
+
+            role_arn: (string): The IAM role arn which enables the Redshift
+            cluster to read from S3.
+
+        Returns:
+            dict
+        """
+        start_time = time.time()
+        query = task['query']
+
+        logger.info(
+            f"Copying S3 data from {task['bucket']} to '{task['vault']}"
+            f".{task['table']}'"
+        )
+
+        with self.labelled(task):
+            self.execute_query(query=query(role_arn=role_arn, **task))
+
+            end_time = round(time.time() - start_time, 2)
+            logger.info(
+                f"S3 data copied from {task['bucket']} to '{task['vault']}"
+                f".{task['table']}' in {end_time} secs"
+            )
+
+            query_id, rows = self.execute_query(query=last_copy())[0]
+            files = self.execute_query(query=load_commits(query_id=query_id))
+            errors = self.execute_query(query=load_errors(query_id=query_id))
+            analysis = self.execute_query(
+                query=copy_analysis(query_id=query_id)
+            )[0][0]
+
+        analysis = float(analysis or 0)
+
+        if analysis:
+            logger.info(
+                f"{analysis} secs of the COPY to '{task['vault']}"
+                f".{task['table']}' spent on compression analysis and "
+                f"statistics, saved by the 'fast' load profile"
+            )
+
+        for column, reason, count in errors or []:
+            logger.warning(
+                f"{count} rows rejected by '{task['vault']}.{task['table']}'"
+                f" ({column}: {reason})"
+            )
+
+        result = {
+            'table': f"{task['vault']}.{task['table']}",
+            'secs': end_time,
+            'rows': rows,
+            'files': files[0][0] if files else 0,
+            'last_file': files[0][1] if files else None,
+            'rejects': sum(x[2] for x in errors or []),
+            'analysis_secs': round(analysis, 2),
+            'query_id': query_id,
+        }
+
+        metrics.observe('copy_seconds', end_time, table=result['table'])
+        for key in ('rows', 'files', 'rejects'):
+            metrics.counter(
+                f'copy_{key}_total', result[key], table=result['table']
+            )
+
+        return result
+
+    def analyze_copied_tables(self, manifest):
+        """
+        Analyze the tables loaded by the JSON COPYs of a copy_data manifest
+        under the 'fast' load profile, which skip statistics. Each table is
+        analyzed once, on the union of the columns listed under the
+        `analyze` keys of its tasks, which the transforms filter and join
+        on. Parquet COPYs update statistics themselves and are left out.
+
+        Args:
+            manifest (list): The copy_data manifest.
+
+        Returns:
+            dict: Table name mapped to the seconds its ANALYZE took.
+        """
+        columns = {}
+
         for task in manifest:
+            profile = task.get('load_profile', DWH_LOAD_PROFILE)
+
+            if task['query'] is not copy_json_from_s3 or profile != 'fast':
+                continue
+
+            table = columns.setdefault((task['vault'], task['table']), [])
+            table.extend(x for x in task.get('analyze', ()) if x not in table)
+
+        return {
+            f'{schema}.{table}': self.analyze_table(
+                schema=schema,
+                table=table,
+                columns=tuple(names),
+            )
+            for (schema, table), names in columns.items() if names
+        }
+
+    def analyze_table(self, schema, table, columns):
+        """
+        Update the statistics of the given columns of a table, rather than
+        of every column as the COPY would.
+
+        Args:
+            schema (string): Schema of the table to analyze.
+
+            table (string): Name of the table to analyze.
+
+            columns (tuple): Names of the columns to analyze.
+
+        Returns:
+            float: The seconds taken.
+        """
+        start_time = time.time()
+
+        self.execute_query(
+            query=analyze_columns(schema=schema, table=table, columns=columns)
+        )
+
+        end_time = round(time.time() - start_time, 2)
+        logger.info(
+            f"'{schema}.{table}' analyzed on {len(columns)} columns in "
+            f"{end_time} secs"
+        )
+
+        return end_time
+
+    def get_table_info(self):
+        """
+        Return the size, unsorted percentage, staleness of the statistics,
+        distribution style and first sort key column of every table in the
+        data warehouse vaults, read from the svv_table_info system view.
+        Empty tables are not listed by the view.
+
+        Returns:
+            list
+        """
+        result = self.execute_query(query=table_info(self.dwh_db_vaults))
+        keys = (
+            'schema',
+            'table',
+            'tbl_rows',
+            'estimated_visible_rows',
+            'unsorted',
+            'stats_off',
+            'diststyle',
+            'sortkey1',
+        )
+
+        return [dict(zip(keys, row)) for row in result or []]
+
+    def get_compression(self, schema, table):
+        """
+        Execute ANALYZE COMPRESSION on a table and return the encoding it
+        recommends for each column, with the estimated reduction in size.
+
+        Args:
+            schema (string): Schema of the table to analyze.
+
+            table (string): Name of the table to analyze.
+
+        Returns:
+            dict: Column name mapped to a tuple of the recommended encoding
+            and the estimated reduction in percent.
+        """
+        result = self.execute_query(
+            query=analyze_compression(schema=schema, table=table)
+        )
+
+        return {
+            column.strip(): (encoding.strip().upper(), float(reduction))
+            for _, column, encoding, reduction in result or []
+        }
+
+    def get_column_blocks(self, schema, table):
+        """
+        Return the number of 1 MB blocks stored for each column of a table,
+        read from the stv_blocklist system table.
+
+        Args:
+            schema (string): Schema of the table.
+
+            table (string): Name of the table.
+
+        Returns:
+            dict: Column name mapped to its number of blocks.
+        """
+        columns = self.execute_query(
+            query=list_columns(schema=schema, table=table)
+        )
+        blocks = dict(
+            self.execute_query(query=column_blocks(table=table)) or []
+        )
+
+        return {
+            row[0]: blocks.get(i, 0) for i, row in enumerate(columns or [])
+        }
+
+    def deep_copy(self, schema, table, create_query):
+        """
+        Rebuild a table with a deep copy: the table is renamed, recreated
+        from its DDL and reloaded in one transaction, which sorts it and
+        reclaims deleted rows. Identity columns are numbered afresh, so
+        tables which have one are not deep copied by maintain_tables().
+
+        Args:
+            schema (string): Schema of the table to rebuild.
+
+            table (string): Name of the table to rebuild.
+
+            create_query (callable): DDL builder of the table, called with
+            the schema as its `vault` argument.
 
+        Returns:
+            None
+        """
+        columns = [
+            row[0] for row in self.execute_query(
+                query=insert_columns(schema=schema, table=table)
+            )
+        ]
+
+        self.execute_query(query=deep_copy_table(
+            schema=schema,
+            table=table,
+            create_query=create_query,
+            columns=columns,
+        ))
+
+        logger.info(f"'{schema}.{table}' rebuilt with a deep copy")
+
+    def alter_layout(self, schema, table, layout):
+        """
+        Change the distribution style and compound sort key of a table in
+        place, which keeps its rows, and so the values of its identity
+        columns, unlike a deep copy. Each ALTER is executed outside of a
+        transaction, as Redshift requires. Interleaved sort keys cannot be
+        altered in place.
+
+        Args:
+            schema (string): Schema of the table.
+
+            table (string): Name of the table.
+
+            layout (dict): The diststyle, distkey, sortkey and sortstyle of
+            the table, as planned by plan_layouts().
+
+        Returns:
+            None
+        """
+        self.execute_autocommit(alter_table_diststyle(
+            schema=schema,
+            table=table,
+            diststyle=layout['diststyle'],
+            distkey=layout.get('distkey'),
+        ))
+        self.execute_autocommit(alter_table_sortkey(
+            schema=schema,
+            table=table,
+            sortkey=layout['sortkey'],
+        ))
+
+        logger.info(f"'{schema}.{table}' layout altered in place")
+
+    def has_identity(self, schema, table):
+        """
+        Return True if a table has an identity column.
+
+        Args:
+            schema (string): Schema of the table.
+
+            table (string): Name of the table.
+
+        Returns:
+            bool
+        """
+        return bool(self.execute_query(
+            query=identity_columns(schema=schema, table=table)
+        ))
+
+    def maintain_tables(self, plan, manifest):
+        """
+        Execute the maintenance actions planned for each table by
+        plan_maintenance(). VACUUM commands are executed outside of a
+        transaction and deep copies recreate the table from its create_tables
+        task. Tables with an identity column, such as fact_songplays, are
+        vacuumed in full instead of deep copied, so that the keys of their
+        rows, which are exported to consumers, never change.
+
+        Args:
+            plan (list): Dictionaries of the schema, table and actions of
+            each table which needs maintenance.
+
+            manifest (list): The create_tables manifest, used to recreate
+            tables which are deep copied.
+
+        Returns:
+            dict: Table name mapped to the seconds taken.
+        """
+        ddl = {(x['vault'], x['table']): x for x in manifest}
+        timings = {}
+
+        for item in plan:
+            schema, table = item['schema'], item['table']
             start_time = time.time()
-            query = task['query']
 
+            for action in item['actions']:
+                if action == 'deep_copy' and self.has_identity(
+                    schema=schema,
+                    table=table,
+                ):
+                    logger.info(
+                        f"'{schema}.{table}' has an identity column, "
+                        f"vacuumed in full rather than deep copied"
+                    )
+                    self.execute_autocommit(
+                        vacuum_table(schema=schema, table=table, mode='full')
+                    )
+                elif action == 'deep_copy':
+                    task = ddl[(schema, table)]
+                    self.deep_copy(
+                        schema=schema,
+                        table=table,
+                        create_query=lambda vault, task=task: task['query'](
+                            **dict(task, vault=vault)
+                        ),
+                    )
+                elif action == 'vacuum_delete':
+                    self.execute_autocommit(
+                        vacuum_table(schema=schema, table=table, mode='delete')
+                    )
+                elif action == 'vacuum_sort':
+                    self.execute_autocommit(
+                        vacuum_table(schema=schema, table=table, mode='sort')
+                    )
+                elif action == 'analyze':
+                    self.execute_query(
+                        query=analyze_columns(schema=schema, table=table)
+                    )
+
+            end_time = round(time.time() - start_time, 2)
+            timings[f'{schema}.{table}'] = end_time
             logger.info(
-                f"Copying S3 data from {task['bucket']} to '{task['vault']}"
-                f".{task['table']}'"
+                f"'{schema}.{table}' maintained with "
+                f"{', '.join(item['actions'])} in {end_time} secs "
+                f"({item['unsorted']}% unsorted, {item['stats_off']}% "
+                f"stats off)"
             )
 
-            self.execute_query(query=query(role_arn=role_arn, **task))
+        return timings
+
+    def copy_isolated_table(self, task, role_arn):
+        """
+        Execute copy_table() on its own pooled connection. This method is
+        invoked from the worker threads of the task scheduler, so that
+        concurrent COPY commands do not share a cursor.
+
+        Args:
+            task (dict): A copy_data manifest task.
+
+            role_arn: (string): The IAM role arn which enables the Redshift
+            cluster to read from S3.
+
+        Returns:
+            dict
+        """
+        with self.session():
+            return self.copy_table(task=task, role_arn=role_arn)
+
+    def log_copy_summary(self, summary, elapsed):
+        """
+        Log the time taken, rows and files loaded for each table copied by
+        copy_s3_data().
+
+        Args:
+            summary (list): A list of dictionaries returned by copy_table().
+
+            elapsed (float): Wall-clock time of the whole COPY stage.
+
+        Returns:
+            None
+        """
+        logger.info(f'S3 data copy summary ({elapsed} secs wall-clock):')
+
+        for row in summary:
+            logger.info(
+                f"  {row['table']}: {row['rows']} rows from "
+                f"{row['files']} files in {row['secs']} secs, "
+                f"{row['rejects']} rejected, {row['analysis_secs']} secs "
+                f"of COPY analysis, {row['analyze_secs']} secs of ANALYZE"
+            )
+
+    def unload_s3_data(self, manifest, role_arn, parallelism=1,
+                       on_complete=None):
+        """
+        Execute a SQL query to export tables of the dimensional model from the
+        Redshift cluster to S3 as Parquet files. Each UNLOAD is executed with
+        PARALLEL ON, so that every slice writes its own files, and the tables
+        are exported at the same time when parallelism is greater than 1.
+
+        Args:
+            manifest (list): The export_data manifest.
+
+            role_arn: (string): The IAM role arn which enables the Redshift
+            cluster to write to S3.
+
+            parallelism (int): The maximum number of UNLOAD commands to
+            execute at the same time.
+
+            on_complete (callable): Optional callback invoked with each task
+            once its UNLOAD has completed, used to checkpoint the run.
+
+        Returns:
+            dict: Table name mapped to the seconds taken.
+        """
+        def unload_task(task):
+            start_time = time.time()
+            query = task['query']
+
+            with self.labelled(task):
+                self.execute_query(query=query(role_arn=role_arn, **task))
 
             end_time = round(time.time() - start_time, 2)
+            metrics.observe(
+                'unload_seconds', end_time, table=task['public_table']
+            )
             logger.info(
-                f"S3 data copied from {task['bucket']} to '{task['vault']}"
-                f".{task['table']}' in {end_time} secs"
+                f"'{task['public_vault']}.{task['public_table']}' exported to "
+                f"{task['bucket']} in {end_time} secs"
             )
 
+            if on_complete:
+                on_complete(task)
+
+            return end_time
+
+        scheduler = TaskScheduler(max_workers=parallelism)
+
+        return scheduler.run(manifest=manifest, func=unload_task)
+
     def close_connection(self):
         """
-        Close current database session. This function is invoked at the end of
-        the ETL operation.
+        Close every connection in the pool. This function is invoked at the
+        end of the ETL operation.
 
         Returns:
             None
         """
-        self.conn.close()
-        logger.info('Connection closed')
+        self.pool.closeall()
+        metrics.gauge('pool_reconnects', self.pool.reconnects)
+        logger.info(
+            f'Connections closed, {self.pool.reconnects} reconnects during run'
+        )
@@ -1,16 +1,28 @@
 import boto3
-
-from core.logger import log
+import hashlib
+import psycopg2
+import random
+import socket
+import time
+
+from core.logger import (
+    log,
+    metrics,
+)
 from settings.envs import (
     AWS_KEY,
     AWS_REGION,
     AWS_SECRET,
+    DWH_CLUSTER_CACHE_TTL,
     DWH_CLUSTER_IDENTIFIER,
     DWH_CLUSTER_TYPE,
+    DWH_CLUSTER_WAIT_TIMEOUT,
     DWH_NODE_TYPE,
     DWH_NUM_NODES,
+    DWH_PROVISIONING,
     DWH_DB_NAME,
     DWH_DB_PASSWORD,
+    DWH_DB_PORT,
     DWH_DB_USER,
 )
 
@@ -19,7 +31,7 @@ logger = log.setup_custom_logger(__name__)
 
 class RedshiftOperator:
 
-    def __init__(self):
+    def __init__(self, client=None):
 
         self.dwh_cluster_id = DWH_CLUSTER_IDENTIFIER
         self.dwh_cluster_type = DWH_CLUSTER_TYPE
@@ -27,7 +39,15 @@ class RedshiftOperator:
         self.dwh_db_user = DWH_DB_USER
         self.dwh_node_type = DWH_NODE_TYPE
         self.dwh_num_nodes = DWH_NUM_NODES
-        self.client = self.create_redshift_client()
+        self.client = client or self.create_redshift_client()
+        self.cache_ttl = DWH_CLUSTER_CACHE_TTL
+        self.api_calls = 0
+        self.cache_hits = 0
+        self._cluster_info = None
+        self._cluster_info_time = None
+        self.wait_timeout = DWH_CLUSTER_WAIT_TIMEOUT
+        self.phase_timings = {}
+        self.provisioning = DWH_PROVISIONING
 
     @property
     def cluster_endpoint(self):
@@ -67,7 +87,7 @@ class RedshiftOperator:
 
         logger.info('Client created')
 
-        return client
+        return metrics.instrument_client(client)
 
     def create_redshift_cluster(self, role_arn):
         """
@@ -89,7 +109,7 @@ class RedshiftOperator:
             logger.info(
                 f"Please wait, '{self.dwh_cluster_id}' is still deleting..."
             )
-            self.wait_for_cluster()
+            self.wait_for_cluster(target='deleted')
 
         logger.info(f"Creating '{self.dwh_cluster_id}'")
 
@@ -105,13 +125,265 @@ class RedshiftOperator:
                 IamRoles=[role_arn],
                 PubliclyAccessible=True,
             )
+            self.invalidate_cache()
         except self.client.exceptions.ClusterAlreadyExistsFault:
             logger.info(
                 f"'{self.dwh_cluster_id}' already exists!"
             )
+            if self.cluster_status != 'available':
+                self.wait_for_cluster(target='available')
+        else:
+            self.wait_for_cluster(target='available')
+
+        self.wait_for_endpoint()
+
+        logger.info(f"'{self.dwh_cluster_id}' is available")
+
+    def provision_cluster(self, role_arn, schema_version=None):
+        """
+        Makes the Redshift cluster available using the provisioning mode
+        declared in the application config files. In 'create' mode a new,
+        empty cluster is created. In 'snapshot' mode the cluster is restored
+        from the latest snapshot taken for the current schema version, if one
+        exists, so that only new data has to be loaded. In 'pause' mode a
+        paused cluster is resumed. A cluster which is still being deleted,
+        by the teardown of a previous run, is waited for first. The time
+        taken is recorded in `phase_timings`.
+
+        Args:
+            role_arn (string): The IAM role arn which enables the Redshift
+            cluster to read from S3.
+
+            schema_version (string): Fingerprint of the data warehouse DDL,
+            used to identify compatible snapshots.
+
+        Returns:
+            string: The provisioning path taken; 'existing', 'create',
+            'restore' or 'resume'.
+        """
+        start_time = time.monotonic()
+        status = self.cluster_status
+        snapshot_id = None
+
+        if status == 'pausing':
+            logger.info(
+                f"Please wait, '{self.dwh_cluster_id}' is still pausing..."
+            )
+            self.wait_for_cluster(target='paused')
+            status = 'paused'
+
+        if status == 'deleting':
+            # the final snapshot of the deleted cluster is only restorable
+            # once the deletion has completed
+            logger.info(
+                f"Please wait, '{self.dwh_cluster_id}' is still deleting..."
+            )
+            self.wait_for_cluster(target='deleted')
+            status = None
+
+        if status is None and self.provisioning == 'snapshot':
+            snapshot_id = self.find_snapshot(schema_version=schema_version)
+
+        if status in ['available', 'creating', 'modifying']:
+            path = 'existing'
+            self.create_redshift_cluster(role_arn=role_arn)
+        elif status in ['paused', 'resuming']:
+            path = 'resume'
+            self.resume_redshift_cluster()
+        elif snapshot_id:
+            path = 'restore'
+            self.restore_redshift_cluster(
+                snapshot_id=snapshot_id,
+                role_arn=role_arn,
+                schema_version=schema_version,
+            )
+        else:
+            path = 'create'
+            self.create_redshift_cluster(role_arn=role_arn)
+
+        self.record_phase(
+            phase=f'provision:{path}',
+            secs=time.monotonic() - start_time,
+        )
+
+        return path
+
+    def resume_redshift_cluster(self):
+        """
+        Resumes the paused Redshift cluster, then waits until it becomes
+        available. Resuming keeps the data loaded by previous runs and is much
+        quicker than creating a new cluster.
+
+        Returns:
+            None
+        """
+        if self.cluster_status == 'paused':
+            logger.info(f"Resuming '{self.dwh_cluster_id}'")
+            self.client.resume_cluster(ClusterIdentifier=self.dwh_cluster_id)
+            self.invalidate_cache()
+
+        self.wait_for_cluster(target='available')
+        self.wait_for_endpoint()
+
+        logger.info(f"'{self.dwh_cluster_id}' is available")
+
+    def pause_cluster(self):
+        """
+        Pauses the Redshift cluster. This method is invoked from the
+        teardown() method in 'pause' provisioning mode; the cluster stops
+        incurring compute costs but keeps its data for the next run.
+
+        Returns:
+            json
+        """
+        try:
+            response = self.client.pause_cluster(
+                ClusterIdentifier=self.dwh_cluster_id,
+            )
+            self.invalidate_cache()
+        except self.client.exceptions.ClusterNotFoundFault:
+            logger.info(f"Cluster '{self.dwh_cluster_id}' not found!")
         else:
-            self.wait_for_cluster()
-            self.get_cluster_endpoint()
+            logger.info(f"Cluster '{self.dwh_cluster_id}' paused")
+
+            return response
+
+    def snapshot_prefix(self, schema_version):
+        """
+        Return the identifier prefix of the snapshots taken of the cluster for
+        a schema version. Redshift stores identifiers in lowercase, so the
+        prefix is lowercased to match them.
+
+        Args:
+            schema_version (string): Fingerprint of the data warehouse DDL.
+
+        Returns:
+            string
+        """
+        return f'{self.dwh_cluster_id}-{schema_version}-'.lower()
+
+    def snapshot_identifier(self, schema_version, watermark):
+        """
+        Return a new snapshot identifier made up of the cluster identifier,
+        the schema version, a short hash of the data watermark and the time
+        the snapshot was taken.
+
+        Args:
+            schema_version (string): Fingerprint of the data warehouse DDL.
+
+            watermark (string): The load watermark of the data in the cluster.
+
+        Returns:
+            string
+        """
+        watermark_hash = hashlib.sha256(
+            str(watermark).encode('utf-8')
+        ).hexdigest()[:8]
+        timestamp = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+
+        return (
+            f'{self.snapshot_prefix(schema_version)}{watermark_hash}-'
+            f'{timestamp}'
+        )
+
+    def list_snapshots(self, prefix):
+        """
+        Return the available manual snapshots whose identifiers start with
+        prefix, newest first. Identifiers are compared in lowercase.
+
+        Args:
+            prefix (string): The snapshot identifier prefix.
+
+        Returns:
+            list
+        """
+        snapshots = []
+        prefix = prefix.lower()
+        paginator = self.client.get_paginator('describe_cluster_snapshots')
+
+        for page in paginator.paginate(SnapshotType='manual'):
+            for snapshot in page['Snapshots']:
+                identifier = snapshot['SnapshotIdentifier'].lower()
+                if (identifier.startswith(prefix)
+                        and snapshot['Status'] == 'available'):
+                    snapshots.append(snapshot)
+
+        return sorted(
+            snapshots,
+            key=lambda x: x['SnapshotCreateTime'],
+            reverse=True,
+        )
+
+    def find_snapshot(self, schema_version):
+        """
+        Return the identifier of the latest snapshot taken for a schema
+        version, or None if there is no such snapshot.
+
+        Args:
+            schema_version (string): Fingerprint of the data warehouse DDL.
+
+        Returns:
+            string
+        """
+        snapshots = self.list_snapshots(
+            prefix=self.snapshot_prefix(schema_version)
+        )
+
+        if not snapshots:
+            logger.info(f'No snapshot found for schema {schema_version}')
+            return None
+
+        snapshot_id = snapshots[0]['SnapshotIdentifier']
+        logger.info(f"Snapshot '{snapshot_id}' found")
+
+        return snapshot_id
+
+    def restore_redshift_cluster(self, snapshot_id, role_arn,
+                                 schema_version):
+        """
+        Restores the Redshift cluster from a snapshot with the configuration
+        declared in the application config files, then waits until it becomes
+        available. Older snapshots of the same schema version are deleted;
+        snapshots of other schema versions are kept.
+
+        Args:
+            snapshot_id (string): Identifier of the snapshot to restore.
+
+            role_arn (string): The IAM role arn which enables the Redshift
+            cluster to read from S3.
+
+            schema_version (string): Fingerprint of the data warehouse DDL
+            the snapshot was taken with.
+
+        Returns:
+            None
+        """
+        logger.info(f"Restoring '{self.dwh_cluster_id}' from '{snapshot_id}'")
+
+        self.client.restore_from_cluster_snapshot(
+            ClusterIdentifier=self.dwh_cluster_id,
+            SnapshotIdentifier=snapshot_id,
+            NodeType=self.dwh_node_type,
+            NumberOfNodes=int(self.dwh_num_nodes),
+            IamRoles=[role_arn],
+            PubliclyAccessible=True,
+        )
+        self.invalidate_cache()
+        self.wait_for_cluster(target='available')
+        self.wait_for_endpoint()
+
+        snapshots = self.list_snapshots(
+            prefix=self.snapshot_prefix(schema_version)
+        )
+
+        for snapshot in snapshots:
+            if snapshot['SnapshotIdentifier'].lower() != snapshot_id.lower():
+                self.client.delete_cluster_snapshot(
+                    SnapshotIdentifier=snapshot['SnapshotIdentifier'],
+                )
+                logger.info(
+                    f"Snapshot '{snapshot['SnapshotIdentifier']}' deleted"
+                )
 
         logger.info(f"'{self.dwh_cluster_id}' is available")
 
@@ -147,36 +419,83 @@ class RedshiftOperator:
 
         return endpoint
 
-    def get_cluster_info(self):
+    def get_cluster_info(self, refresh=False):
         """
         Return a dictionary of the cluster information. The result of this
-        method is assigned as a property of this class.
+        method is assigned as a property of this class. The response of
+        describe_clusters is cached for `cache_ttl` seconds, so that reading
+        the endpoint and status properties repeatedly does not call the
+        Redshift API each time.
+
+        Args:
+            refresh (bool): Set to True to bypass the cache.
 
         Returns:
             json
         """
+        now = time.monotonic()
+
+        if (not refresh
+                and self._cluster_info_time is not None
+                and now - self._cluster_info_time < self.cache_ttl):
+            self.cache_hits += 1
+            return self._cluster_info
+
+        self.api_calls += 1
+
         try:
             info = self.client.describe_clusters(
                 ClusterIdentifier=self.dwh_cluster_id,
             )
         except TypeError:
-            return None
+            info = None
         except self.client.exceptions.ClusterNotFoundFault:
-            return None
+            info = None
+
+        self._cluster_info = info
+        self._cluster_info_time = now
 
         return info
 
-    def get_cluster_status(self):
+    def invalidate_cache(self):
+        """
+        Discard the cached cluster information. This method is invoked after
+        every call which changes the state of the cluster.
+
+        Returns:
+            None
+        """
+        self._cluster_info = None
+        self._cluster_info_time = None
+
+    def log_cache_stats(self):
+        """
+        Log the number of describe_clusters calls made and the number of
+        calls saved by the cluster information cache.
+
+        Returns:
+            None
+        """
+        logger.info(
+            f'describe_clusters calls: {self.api_calls}, '
+            f'saved by cache: {self.cache_hits}'
+        )
+
+    def get_cluster_status(self, refresh=False):
         """
         Return the status of the cluster. This method is used to check the
         status of the cluster to determine whether the application should
         wait for availability.
 
+        Args:
+            refresh (bool): Set to True to bypass the cluster info cache.
+
         Returns:
             string
         """
         try:
-            status = self.cluster_info['Clusters'][0]['ClusterStatus']
+            info = self.get_cluster_info(refresh=refresh)
+            status = info['Clusters'][0]['ClusterStatus']
         except TypeError:
             return None
         except self.client.exceptions.ClusterNotFoundFault:
@@ -184,7 +503,44 @@ class RedshiftOperator:
 
         return status
 
-    def wait_for_cluster(self):
+    def backoff_delays(self, base=2, cap=30):
+        """
+        Generate polling delays which grow exponentially from `base` up to
+        `cap` seconds, with jitter so that pipelines sharing an account do not
+        poll the Redshift API in lockstep.
+
+        Args:
+            base (float): The first delay in seconds.
+
+            cap (float): The maximum delay in seconds.
+
+        Returns:
+            generator
+        """
+        delay = base
+
+        while True:
+            yield random.uniform(delay / 2, delay)
+            delay = min(cap, delay * 1.5)
+
+    def record_phase(self, phase, secs):
+        """
+        Add the time spent in a provisioning phase, such as a cluster state,
+        to the phase timings of this class.
+
+        Args:
+            phase (string): Name of the phase.
+
+            secs (float): Time spent in the phase.
+
+        Returns:
+            None
+        """
+        self.phase_timings[phase] = round(
+            self.phase_timings.get(phase, 0) + secs, 2
+        )
+
+    def wait_for_cluster(self, target=None):
         """
         Conditionally waits for cluster availability. If the cluster is in the
         process of being created, the application will wait until it becomes
@@ -192,58 +548,163 @@ class RedshiftOperator:
         the application will wait until it is deleted before attempting to
         create it again.
 
+        The cluster status is polled with exponential backoff and jitter, and
+        the time spent in each cluster state is added to `phase_timings`.
+
+        Args:
+            target (string): The status to wait for, either 'available' or
+            None for a deleted cluster. By default, the target is chosen from
+            the current status of the cluster.
+
         Returns:
             None
         """
-        if self.cluster_status in ['creating', 'available']:
-            waiter_type = 'cluster_available'
-        else:
-            waiter_type = 'cluster_deleted'
+        start_time = time.monotonic()
+        last_poll = start_time
+        status = self.get_cluster_status(refresh=True)
+
+        if target is None and status not in ['creating', 'available']:
+            target = 'deleted'
+        elif target is None:
+            target = 'available'
 
         logger.info(
             f"Waiting for '{self.dwh_cluster_id}'..."
         )
 
-        waiter = self.client.get_waiter(waiter_type)
-        waiter.wait(
-            ClusterIdentifier=self.dwh_cluster_id,
-            WaiterConfig={
-                'Delay': 5,
-                'MaxAttempts': 100,
-            }
+        for delay in self.backoff_delays():
+            if (target == 'deleted' and status is None) or status == target:
+                break
+
+            if time.monotonic() - start_time > self.wait_timeout:
+                raise TimeoutError(
+                    f"'{self.dwh_cluster_id}' is still '{status}' after "
+                    f"{self.wait_timeout} secs"
+                )
+
+            logger.debug(f"'{self.dwh_cluster_id}' is '{status}'")
+            time.sleep(delay)
+
+            now = time.monotonic()
+            self.record_phase(phase=status, secs=now - last_poll)
+            last_poll = now
+            status = self.get_cluster_status(refresh=True)
+
+        logger.info(
+            f"'{self.dwh_cluster_id}' is '{target}' after "
+            f"{round(time.monotonic() - start_time, 2)} secs"
         )
 
-    def delete_cluster(self):
+    def wait_for_endpoint(self):
+        """
+        Waits until the cluster endpoint accepts TCP connections and answers
+        a trivial query. A cluster can report itself as available shortly
+        before its leader node accepts sessions; this check avoids handing an
+        unusable endpoint to the PostgreSQLOperator.
+
+        Returns:
+            None
+        """
+        start_time = time.monotonic()
+        endpoint = self.cluster_endpoint
+
+        for delay in self.backoff_delays(base=1, cap=10):
+            try:
+                with socket.create_connection(
+                        (endpoint, int(DWH_DB_PORT)), timeout=5):
+                    pass
+
+                conn = psycopg2.connect(
+                    host=endpoint,
+                    dbname=self.dwh_db_name,
+                    user=self.dwh_db_user,
+                    password=DWH_DB_PASSWORD,
+                    port=DWH_DB_PORT,
+                    connect_timeout=5,
+                )
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute('SELECT 1;')
+                finally:
+                    conn.close()
+                break
+            except (OSError, psycopg2.Error) as e:
+                if time.monotonic() - start_time > self.wait_timeout:
+                    raise TimeoutError(
+                        f"'{endpoint}' is not accepting connections: {e}"
+                    )
+                logger.debug(f"'{endpoint}' not ready: {e}")
+                time.sleep(delay)
+
+        self.record_phase(phase='endpoint', secs=time.monotonic() - start_time)
+
+        logger.info(f"'{endpoint}' is accepting connections")
+
+    def log_phase_timings(self):
+        """
+        Log the time spent in each provisioning phase of the cluster.
+
+        Returns:
+            None
+        """
+        for phase, secs in self.phase_timings.items():
+            logger.info(
+                f"'{self.dwh_cluster_id}' phase '{phase}': {secs} secs"
+            )
+
+    def delete_cluster(self, snapshot_id=None):
         """
         Deletes the cluster created by the application. This method is invoked
         from the teardown() method which is executed when the application is
         in dry_run mode.
 
+        Args:
+            snapshot_id (string): Identifier of a final snapshot to take
+            before the cluster is deleted. No snapshot is taken by default.
+
         Returns:
             json
         """
+        if snapshot_id:
+            snapshot = {
+                'SkipFinalClusterSnapshot': False,
+                'FinalClusterSnapshotIdentifier': snapshot_id,
+            }
+            logger.info(f"Taking final snapshot '{snapshot_id}'")
+        else:
+            snapshot = {'SkipFinalClusterSnapshot': True}
+
         try:
             response = self.client.delete_cluster(
                 ClusterIdentifier=self.dwh_cluster_id,
-                SkipFinalClusterSnapshot=True,
+                **snapshot,
             )
-        except self.client.exceptions.NoSuchEntityException:
+            self.invalidate_cache()
+        except self.client.exceptions.ClusterNotFoundFault:
             logger.info(f"Cluster '{self.dwh_cluster_id}' already deleted!")
         else:
             logger.info(f"Cluster '{self.dwh_cluster_id}' deleted")
 
             return response
 
-    def teardown(self):
+    def teardown(self, snapshot_id=None):
         """
         Invokes delete_cluster() to delete the cluster created by this
         application. This method is invoked when the application is in
         `dry_run` mode; the AWS infrastructure is torn down upon completion
-        of the ETL process.
+        of the ETL process. In 'pause' provisioning mode, the cluster is
+        paused instead of deleted.
+
+        Args:
+            snapshot_id (string): Identifier of a final snapshot to take
+            before the cluster is deleted.
 
         Returns:
             None
         """
-        self.delete_cluster()
+        if self.provisioning == 'pause':
+            self.pause_cluster()
+        else:
+            self.delete_cluster(snapshot_id=snapshot_id)
 
         logger.info('Teardown complete')
@@ -0,0 +1,140 @@
+import boto3
+import json
+
+from core.logger import (
+    log,
+    metrics,
+)
+from settings.envs import (
+    AWS_KEY,
+    AWS_REGION,
+    AWS_SECRET,
+    S3_ENDPOINT_URL,
+)
+
+logger = log.setup_custom_logger(__name__)
+
+
+def split_s3_path(path):
+    """
+    Split an S3 path into its bucket name and key prefix.
+
+    Args:
+        path (string): An S3 path, such as s3://udacity-dend/log_data.
+
+    Returns:
+        tuple
+    """
+    bucket, _, prefix = path.replace('s3://', '', 1).partition('/')
+
+    return bucket, prefix
+
+
+class S3Operator:
+
+    def __init__(self):
+
+        self.client = self.create_s3_client()
+
+    def create_s3_client(self):
+        """
+        Creates an S3 client with the credentials declared in the application
+        config files. The application uses this client to inspect the data
+        lake before loading data to the Redshift cluster.
+
+        Returns:
+            boto3.client
+        """
+        client = boto3.client(
+            service_name='s3',
+            region_name=AWS_REGION,
+            aws_access_key_id=AWS_KEY,
+            aws_secret_access_key=AWS_SECRET,
+            endpoint_url=S3_ENDPOINT_URL,
+        )
+
+        logger.info('Client created')
+
+        return metrics.instrument_client(client)
+
+    def list_objects(self, path, start_after=None):
+        """
+        Return an inventory of the objects under an S3 prefix in key order,
+        with the S3 path and size in bytes of each object.
+
+        Args:
+            path (string): The S3 prefix to list, such as
+            s3://udacity-dend/song_data.
+
+            start_after (string): S3 path of the last object already loaded.
+
+        Returns:
+            list
+        """
+        bucket, prefix = split_s3_path(path)
+        params = {'Bucket': bucket, 'Prefix': prefix}
+
+        if start_after:
+            params['StartAfter'] = split_s3_path(start_after)[1]
+
+        objects = []
+        paginator = self.client.get_paginator('list_objects_v2')
+
+        for page in paginator.paginate(**params):
+            for obj in page.get('Contents', []):
+                if not obj['Key'].endswith('/'):
+                    objects.append({
+                        'path': f"s3://{bucket}/{obj['Key']}",
+                        'size': obj['Size'],
+                    })
+
+        logger.debug(f'{len(objects)} objects found under {path}')
+
+        return objects
+
+    def write_manifest(self, entries, path):
+        """
+        Write a COPY manifest file, so that a single COPY loads exactly the
+        objects it lists.
+
+        Args:
+            entries (list): COPY manifest entries, each with the 'url' of an
+            object.
+
+            path (string): S3 path of the manifest file.
+
+        Returns:
+            string: S3 path of the manifest file.
+        """
+        bucket, key = split_s3_path(path)
+
+        self.client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=json.dumps({'entries': entries}).encode('utf-8'),
+        )
+
+        logger.info(
+            f'COPY manifest of {len(entries)} objects written to {path}'
+        )
+
+        return path
+
+    def list_keys(self, path, start_after=None):
+        """
+        Return the S3 paths of all objects under an S3 prefix in key order.
+        When start_after is given, only the objects whose keys sort after it
+        are returned; this is how new log partitions are found.
+
+        Args:
+            path (string): The S3 prefix to list, such as
+            s3://udacity-dend/log_data.
+
+            start_after (string): S3 path of the last object already loaded.
+
+        Returns:
+            list
+        """
+        objects = self.list_objects(path=path, start_after=start_after)
+
+        return [obj['path'] for obj in objects]
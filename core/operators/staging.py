@@ -0,0 +1,204 @@
+import gzip
+import heapq
+import math
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from core.logger import log
+from core.operators.columnar import (
+    json_to_arrow,
+    to_parquet,
+)
+from core.operators.s3 import (
+    S3Operator,
+    split_s3_path,
+)
+from settings.envs import (
+    DWH_STAGING_OBJECT_MB,
+    DWH_STAGING_WORKERS,
+)
+
+logger = log.setup_custom_logger(__name__)
+
+# s3 client of a staging worker process, created on first use
+_s3 = None
+
+
+def plan_parts(objects, slices, object_bytes):
+    """
+    Pack an inventory of S3 objects into parts of even size. The number of
+    parts is a multiple of the cluster's slice count, so that every slice
+    loads the same amount of data, and is raised until no part exceeds the
+    target object size. Objects are placed largest first into the smallest
+    part.
+
+    Args:
+        objects (list): Inventory of the source objects, as returned by
+        S3Operator.list_objects().
+
+        slices (int): The number of slices in the Redshift cluster.
+
+        object_bytes (int): Target size of a part before compression.
+
+    Returns:
+        list: A list of S3 paths for each part.
+    """
+    if not objects:
+        return []
+
+    total = sum(obj['size'] for obj in objects)
+    multiple = max(1, math.ceil(total / (slices * object_bytes)))
+    count = min(slices * multiple, len(objects))
+
+    heap = [(0, i) for i in range(count)]
+    parts = [[] for _ in range(count)]
+
+    for obj in sorted(objects, key=lambda x: x['size'], reverse=True):
+        size, i = heapq.heappop(heap)
+        parts[i].append(obj['path'])
+        heapq.heappush(heap, (size + obj['size'], i))
+
+    # keep key order within a part so that staging is deterministic
+    return [sorted(part) for part in parts]
+
+
+def stage_part(paths, destination, columns=None):
+    """
+    Concatenate the JSON objects of one part into a single gzip object or,
+    when columns are given, convert them into a single Parquet object with
+    typed columns. This function runs in a worker process of the
+    StagingOperator, which creates its own S3 client.
+
+    Args:
+        paths (list): S3 paths of the source objects of the part.
+
+        destination (string): S3 path of the object to write.
+
+        columns (list): Tuples of column name, JSON field and Arrow type of
+        the raw vault table, as declared in raw_schemas.
+
+    Returns:
+        dict: A COPY manifest entry for the staged object.
+    """
+    global _s3
+
+    if _s3 is None:
+        _s3 = S3Operator()
+
+    chunks = []
+
+    for path in paths:
+        bucket, key = split_s3_path(path)
+        body = _s3.client.get_object(Bucket=bucket, Key=key)['Body'].read()
+        chunks.append(body if body.endswith(b'\n') else body + b'\n')
+
+    if columns:
+        data = to_parquet(json_to_arrow(b''.join(chunks), columns=columns))
+    else:
+        data = gzip.compress(b''.join(chunks))
+
+    bucket, key = split_s3_path(destination)
+    _s3.client.put_object(Bucket=bucket, Key=key, Body=data)
+
+    return {
+        'url': destination,
+        'mandatory': True,
+        'meta': {'content_length': len(data)},
+    }
+
+
+class StagingOperator:
+
+    def __init__(self, s3=None, workers=DWH_STAGING_WORKERS,
+                 object_mb=DWH_STAGING_OBJECT_MB):
+
+        self.s3 = s3 or S3Operator()
+        self.workers = workers
+        self.object_bytes = object_mb * 1024 * 1024
+
+    def stage(self, source, destination, slices, columns=None,
+              objects=None):
+        """
+        Pre-stage the JSON objects under an S3 prefix for COPY. The objects
+        are packed into gzip objects of even size, a multiple of the slice
+        count in number, and written under the destination prefix by a pool
+        of worker processes along with a COPY manifest file which lists them.
+        Loading a few large, compressed files keeps every slice busy, where
+        thousands of small files are each listed and opened by Redshift.
+        When columns are given, the parts are converted to Parquet instead,
+        so the cluster does not have to parse JSON.
+
+        Args:
+            source (string): The S3 prefix of the source objects, such as
+            s3://udacity-dend/song_data.
+
+            destination (string): The S3 prefix to write staged objects to.
+
+            slices (int): The number of slices in the Redshift cluster.
+
+            columns (list): Tuples of column name, JSON field and Arrow type
+            of the raw vault table, to convert the parts to Parquet.
+
+            objects (list): Optional inventory of the source objects, as
+            returned by S3Operator.list_objects(), to stage instead of every
+            object under the source prefix.
+
+        Returns:
+            string: S3 path of the COPY manifest file.
+        """
+        start_time = time.time()
+
+        if objects is None:
+            objects = self.s3.list_objects(path=source)
+
+        parts = plan_parts(
+            objects=objects,
+            slices=slices,
+            object_bytes=self.object_bytes,
+        )
+        extension = 'parquet' if columns else 'json.gz'
+        destinations = [
+            f'{destination}/part-{i:05d}.{extension}'
+            for i in range(len(parts))
+        ]
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            entries = list(executor.map(
+                stage_part,
+                parts,
+                destinations,
+                [columns] * len(parts),
+            ))
+
+        manifest_path = self.write_manifest(
+            entries=entries,
+            destination=destination,
+        )
+
+        end_time = round(time.time() - start_time, 2)
+        staged = sum(entry['meta']['content_length'] for entry in entries)
+        logger.info(
+            f'{len(objects)} objects under {source} staged as {len(parts)} '
+            f'{extension} objects ({staged} bytes) in {end_time} secs'
+        )
+
+        return manifest_path
+
+    def write_manifest(self, entries, destination):
+        """
+        Write a COPY manifest file listing the staged objects under the
+        destination prefix.
+
+        Args:
+            entries (list): COPY manifest entries of the staged objects.
+
+            destination (string): The S3 prefix of the staged objects.
+
+        Returns:
+            string: S3 path of the manifest file.
+        """
+        return self.s3.write_manifest(
+            entries=entries,
+            path=f'{destination}/manifest.json',
+        )
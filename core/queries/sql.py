@@ -1,8 +1,10 @@
 from psycopg2 import sql
 
 from settings.envs import (
+    DWH_COPY_MAXERROR,
     DWH_DB_PUBLIC_VAULT,
     DWH_DB_RAW_VAULT,
+    DWH_LOAD_PROFILE,
 )
 
 
@@ -16,6 +18,30 @@ def create_schema(schema):
     ).format(schema=schema)
 
 
+# set a session parameter, such as query_group or search_path
+def set_session_parameter(name, value):
+
+    if isinstance(value, (list, tuple)):
+        value = sql.SQL(', ').join(sql.Identifier(x) for x in value)
+    else:
+        value = sql.Literal(value)
+
+    return sql.SQL(
+        "SET {name} TO {value};"
+    ).format(
+        name=sql.Identifier(name),
+        value=value,
+    )
+
+
+# restore a session parameter to its default
+def reset_session_parameter(name):
+
+    return sql.SQL(
+        "RESET {name};"
+    ).format(name=sql.Identifier(name))
+
+
 # drop raw_vault tables
 def drop_table(schema, table):
 
@@ -52,18 +78,31 @@ def copy_json_from_s3(
         table,
         jsonpaths='auto',
         vault=DWH_DB_RAW_VAULT,
+        manifest=False,
+        gzip=False,
+        maxerror=DWH_COPY_MAXERROR,
+        load_profile=DWH_LOAD_PROFILE,
         **kwargs):
 
+    if load_profile == 'fast':
+        analysis = sql.SQL('COMPUPDATE OFF STATUPDATE OFF')
+    else:
+        analysis = sql.SQL('COMPUPDATE ON')
+
     return sql.SQL(
         """
         COPY {vault}.{table}
         FROM {bucket}
         CREDENTIALS {role_arn}
         REGION {region}
-        COMPUPDATE ON
+        {analysis}
         FORMAT AS JSON {jsonpaths}
+        {manifest}
+        {gzip}
         EMPTYASNULL
-        BLANKSASNULL;
+        BLANKSASNULL
+        TRUNCATECOLUMNS
+        MAXERROR {maxerror};
         """
     ).format(
         vault=sql.Identifier(vault),
@@ -72,6 +111,510 @@ def copy_json_from_s3(
         role_arn=sql.Literal(f'aws_iam_role={role_arn}'),
         region=sql.Literal(region),
         jsonpaths=sql.Literal(jsonpaths),
+        analysis=analysis,
+        manifest=sql.SQL('MANIFEST' if manifest else ''),
+        gzip=sql.SQL('GZIP' if gzip else ''),
+        maxerror=sql.Literal(maxerror),
+    )
+
+
+def copy_parquet_from_s3(
+        bucket,
+        role_arn,
+        table,
+        vault=DWH_DB_RAW_VAULT,
+        manifest=False,
+        **kwargs):
+
+    return sql.SQL(
+        """
+        COPY {vault}.{table}
+        FROM {bucket}
+        CREDENTIALS {role_arn}
+        FORMAT AS PARQUET
+        {manifest};
+        """
+    ).format(
+        vault=sql.Identifier(vault),
+        table=sql.Identifier(table),
+        bucket=sql.Literal(bucket),
+        role_arn=sql.Literal(f'aws_iam_role={role_arn}'),
+        manifest=sql.SQL('MANIFEST' if manifest else ''),
+    )
+
+
+# count the slices of the cluster
+def count_slices():
+
+    return sql.SQL(
+        """
+        SELECT COUNT(*) FROM stv_slices;
+        """
+    )
+
+
+# truncate a table
+def truncate_table(schema, table):
+
+    return sql.SQL(
+        "TRUNCATE TABLE {schema}.{table};"
+    ).format(
+        schema=sql.Identifier(schema),
+        table=sql.Identifier(table)
+    )
+
+
+# read the load watermark of a source table
+def get_watermark(source, vault=DWH_DB_RAW_VAULT):
+
+    return sql.SQL(
+        """
+        SELECT
+            watermark,
+            max_ts
+        FROM {vault}.etl_watermarks
+        WHERE source = {source};
+        """
+    ).format(
+        vault=sql.Identifier(vault),
+        source=sql.Literal(source),
+    )
+
+
+# record the load watermark of a source table
+def set_watermark(source, watermark, vault=DWH_DB_RAW_VAULT):
+
+    return sql.SQL(
+        """
+        BEGIN;
+
+        DELETE FROM {vault}.etl_watermarks
+        WHERE source = {source};
+
+        INSERT INTO {vault}.etl_watermarks (
+            source,
+            watermark,
+            max_ts,
+            updated_at
+        )
+        SELECT
+            {source},
+            {watermark},
+            Max(ts),
+            GETDATE()
+        FROM {vault}.{table};
+
+        COMMIT;
+        """
+    ).format(
+        vault=sql.Identifier(vault),
+        table=sql.Identifier(source),
+        source=sql.Literal(source),
+        watermark=sql.Literal(watermark),
+    )
+
+
+# record a completed pipeline stage, replacing an earlier row of it
+def record_run_state(run_id, stage, fingerprint, vault=DWH_DB_RAW_VAULT):
+
+    return sql.SQL(
+        """
+        DELETE FROM {vault}.etl_run_state
+        WHERE run_id = {run_id}
+            AND stage = {stage};
+
+        INSERT INTO {vault}.etl_run_state (
+            run_id,
+            stage,
+            fingerprint,
+            completed_at
+        )
+        VALUES ({run_id}, {stage}, {fingerprint}, GETDATE());
+        """
+    ).format(
+        vault=sql.Identifier(vault),
+        run_id=sql.Literal(run_id),
+        stage=sql.Literal(stage),
+        fingerprint=sql.Literal(fingerprint),
+    )
+
+
+# row count of the last copy in the current session
+def last_copy():
+
+    return sql.SQL(
+        "SELECT pg_last_copy_id(), pg_last_copy_count();"
+    )
+
+
+# files committed by a copy query, and the last of them in key order
+def load_commits(query_id):
+
+    return sql.SQL(
+        """
+        SELECT
+            COUNT(DISTINCT filename),
+            MAX(TRIM(filename))
+        FROM stl_load_commits
+        WHERE query = {query_id};
+        """
+    ).format(query_id=sql.Literal(query_id))
+
+
+# rows rejected by a copy query
+def load_errors(query_id):
+
+    return sql.SQL(
+        """
+        SELECT
+            TRIM(colname),
+            TRIM(err_reason),
+            COUNT(*)
+        FROM stl_load_errors
+        WHERE query = {query_id}
+        GROUP BY 1, 2
+        ORDER BY 3 DESC;
+        """
+    ).format(query_id=sql.Literal(query_id))
+
+
+# time spent on compression analysis and statistics by a copy query
+def copy_analysis(query_id):
+
+    return sql.SQL(
+        """
+        SELECT
+            COALESCE(SUM(DATEDIFF(ms, starttime, endtime)), 0) / 1000.0
+        FROM stl_query
+        WHERE xid = (SELECT xid FROM stl_query WHERE query = {query_id})
+            AND query <> {query_id}
+            AND (
+                querytxt LIKE 'analyze compression phase%%'
+                OR querytxt LIKE 'padb_fetch_sample%%'
+                OR querytxt LIKE 'COPY ANALYZE%%'
+            );
+        """
+    ).format(query_id=sql.Literal(query_id))
+
+
+# statistics of the queries run under a query_group label, or one of its
+# task labels; the label is compared literally, as LIKE would treat the
+# underscores of stage names as wildcards
+def query_stats(label):
+
+    return sql.SQL(
+        """
+        WITH queries AS (
+            SELECT
+                query,
+                TRIM(label) AS label,
+                DATEDIFF(ms, starttime, endtime) AS elapsed_ms,
+                aborted
+            FROM stl_query
+            WHERE TRIM(label) = {label}
+                OR LEFT(TRIM(label), {length}) = {prefix}
+        ),
+        wlm AS (
+            SELECT
+                query,
+                SUM(total_queue_time) AS queue_us,
+                SUM(total_exec_time) AS exec_us
+            FROM stl_wlm_query
+            WHERE query IN (SELECT query FROM queries)
+            GROUP BY query
+        ),
+        steps AS (
+            SELECT
+                query,
+                SUM(CASE WHEN label LIKE 'scan%%' THEN rows ELSE 0 END)
+                    AS rows_scanned,
+                SUM(CASE WHEN label LIKE 'scan%%' THEN bytes ELSE 0 END)
+                    AS bytes_scanned,
+                SUM(CASE WHEN is_diskbased = 't' THEN 1 ELSE 0 END)
+                    AS spilled_steps
+            FROM svl_query_summary
+            WHERE query IN (SELECT query FROM queries)
+            GROUP BY query
+        ),
+        loads AS (
+            SELECT
+                query,
+                COUNT(DISTINCT filename) AS files,
+                SUM(lines_scanned) AS lines
+            FROM stl_load_commits
+            WHERE query IN (SELECT query FROM queries)
+            GROUP BY query
+        )
+        SELECT
+            q.label,
+            COUNT(*),
+            SUM(q.aborted),
+            SUM(q.elapsed_ms) / 1000.0,
+            COALESCE(SUM(w.queue_us), 0) / 1000000.0,
+            COALESCE(SUM(w.exec_us), 0) / 1000000.0,
+            COALESCE(SUM(s.rows_scanned), 0),
+            COALESCE(SUM(s.bytes_scanned), 0),
+            COALESCE(SUM(s.spilled_steps), 0),
+            COALESCE(SUM(l.files), 0),
+            COALESCE(SUM(l.lines), 0)
+        FROM queries q
+        LEFT JOIN wlm w ON w.query = q.query
+        LEFT JOIN steps s ON s.query = q.query
+        LEFT JOIN loads l ON l.query = q.query
+        GROUP BY 1
+        ORDER BY 1;
+        """
+    ).format(
+        label=sql.Literal(label),
+        length=sql.Literal(len(label) + 1),
+        prefix=sql.Literal(f'{label}:'),
+    )
+
+
+# analyze the given columns of a table, or all of them
+def analyze_columns(schema, table, columns=()):
+
+    if columns:
+        column_list = sql.SQL(' ({})').format(
+            sql.SQL(', ').join(sql.Identifier(x) for x in columns)
+        )
+    else:
+        column_list = sql.SQL('')
+
+    return sql.SQL(
+        "ANALYZE {schema}.{table}{columns};"
+    ).format(
+        schema=sql.Identifier(schema),
+        table=sql.Identifier(table),
+        columns=column_list,
+    )
+
+
+# health of the tables in the given schemas
+def table_info(schemas):
+
+    return sql.SQL(
+        """
+        SELECT
+            TRIM("schema"),
+            TRIM("table"),
+            COALESCE(tbl_rows, 0),
+            COALESCE(estimated_visible_rows, 0),
+            COALESCE(unsorted, 0),
+            COALESCE(stats_off, 0),
+            TRIM(diststyle),
+            TRIM(sortkey1)
+        FROM svv_table_info
+        WHERE "schema" IN ({schemas})
+        ORDER BY 1, 2;
+        """
+    ).format(
+        schemas=sql.SQL(', ').join(sql.Literal(x) for x in schemas),
+    )
+
+
+# vacuum a table
+def vacuum_table(schema, table, mode):
+
+    modes = {'sort': 'SORT ONLY', 'delete': 'DELETE ONLY', 'full': 'FULL'}
+
+    return sql.SQL(
+        "VACUUM {mode} {schema}.{table} TO 100 PERCENT;"
+    ).format(
+        mode=sql.SQL(modes[mode]),
+        schema=sql.Identifier(schema),
+        table=sql.Identifier(table),
+    )
+
+
+# columns of a table which are not identity columns
+def insert_columns(schema, table):
+
+    return sql.SQL(
+        """
+        SELECT
+            column_name
+        FROM information_schema.columns
+        WHERE table_schema = {schema}
+            AND table_name = {table}
+            AND COALESCE(column_default, '') NOT LIKE '%%identity%%'
+        ORDER BY ordinal_position;
+        """
+    ).format(
+        schema=sql.Literal(schema),
+        table=sql.Literal(table),
+    )
+
+
+# identity columns of a table
+def identity_columns(schema, table):
+
+    return sql.SQL(
+        """
+        SELECT
+            column_name
+        FROM information_schema.columns
+        WHERE table_schema = {schema}
+            AND table_name = {table}
+            AND column_default LIKE '%%identity%%'
+        ORDER BY ordinal_position;
+        """
+    ).format(
+        schema=sql.Literal(schema),
+        table=sql.Literal(table),
+    )
+
+
+# query plan of a statement
+def explain(statement):
+
+    return sql.SQL("EXPLAIN {statement}").format(
+        statement=sql.SQL(statement)
+    )
+
+
+# recommend column encodings from a sample of a table
+def analyze_compression(schema, table):
+
+    return sql.SQL(
+        "ANALYZE COMPRESSION {schema}.{table};"
+    ).format(
+        schema=sql.Identifier(schema),
+        table=sql.Identifier(table),
+    )
+
+
+# columns of a table in table order
+def list_columns(schema, table):
+
+    return sql.SQL(
+        """
+        SELECT
+            column_name
+        FROM information_schema.columns
+        WHERE table_schema = {schema}
+            AND table_name = {table}
+        ORDER BY ordinal_position;
+        """
+    ).format(
+        schema=sql.Literal(schema),
+        table=sql.Literal(table),
+    )
+
+
+# 1 mb blocks stored per column of a table
+def column_blocks(table):
+
+    return sql.SQL(
+        """
+        SELECT
+            b.col,
+            COUNT(*)
+        FROM stv_blocklist b
+        JOIN stv_tbl_perm p ON
+            p.id = b.tbl
+            AND p.slice = b.slice
+        WHERE TRIM(p.name) = {table}
+        GROUP BY b.col
+        ORDER BY b.col;
+        """
+    ).format(table=sql.Literal(table))
+
+
+# rebuild a table from its ddl and reload it in sort key order
+def deep_copy_table(schema, table, create_query, columns):
+
+    column_list = sql.SQL(', ').join(sql.Identifier(x) for x in columns)
+
+    return sql.SQL(
+        """
+        BEGIN;
+
+        ALTER TABLE {schema}.{table} RENAME TO {copy_table};
+
+        {create_table}
+
+        INSERT INTO {schema}.{table} ({columns})
+        SELECT {columns} FROM {schema}.{copy_table};
+
+        DROP TABLE {schema}.{copy_table};
+
+        COMMIT;
+        """
+    ).format(
+        schema=sql.Identifier(schema),
+        table=sql.Identifier(table),
+        copy_table=sql.Identifier(f'{table}__deep_copy'),
+        create_table=create_query(vault=schema),
+        columns=column_list,
+    )
+
+
+# export public vault tables to s3 as parquet
+def unload_table_to_s3(
+        bucket,
+        role_arn,
+        public_table,
+        partition_by=None,
+        public_vault=DWH_DB_PUBLIC_VAULT,
+        **kwargs):
+
+    if partition_by:
+        partition = sql.SQL('PARTITION BY ({columns})').format(
+            columns=sql.SQL(', ').join(
+                sql.Identifier(x) for x in partition_by
+            )
+        )
+    else:
+        partition = sql.SQL('')
+
+    return sql.SQL(
+        """
+        UNLOAD ('SELECT * FROM {public_vault}.{public_table}')
+        TO {path}
+        CREDENTIALS {role_arn}
+        FORMAT AS PARQUET
+        PARALLEL ON
+        {partition}
+        ALLOWOVERWRITE;
+        """
+    ).format(
+        public_vault=sql.Identifier(public_vault),
+        public_table=sql.Identifier(public_table),
+        path=sql.Literal(f'{bucket}/{public_table}/'),
+        role_arn=sql.Literal(f'aws_iam_role={role_arn}'),
+        partition=partition,
+    )
+
+
+def unload_table_by_month_to_s3(
+        bucket,
+        role_arn,
+        public_table,
+        time_table='dim_time',
+        public_vault=DWH_DB_PUBLIC_VAULT,
+        **kwargs):
+
+    return sql.SQL(
+        """
+        UNLOAD (
+            'SELECT f.*, t.year, t.month
+            FROM {public_vault}.{public_table} f
+            JOIN {public_vault}.{time_table} t ON t.time_id = f.time_id'
+        )
+        TO {path}
+        CREDENTIALS {role_arn}
+        FORMAT AS PARQUET
+        PARALLEL ON
+        PARTITION BY (year, month)
+        ALLOWOVERWRITE;
+        """
+    ).format(
+        public_vault=sql.Identifier(public_vault),
+        public_table=sql.Identifier(public_table),
+        time_table=sql.Identifier(time_table),
+        path=sql.Literal(f'{bucket}/{public_table}/'),
+        role_arn=sql.Literal(f'aws_iam_role={role_arn}'),
     )
 
 
@@ -81,24 +624,24 @@ def create_table_raw_log_data(vault=DWH_DB_RAW_VAULT, **kwargs):
     return sql.SQL(
         """
         CREATE TABLE IF NOT EXISTS {vault}.raw__log_data (
-            artist VARCHAR(255),
-            auth VARCHAR(255),
-            first_name VARCHAR(255),
-            gender VARCHAR(255),
-            item_in_session VARCHAR(255),
-            last_name VARCHAR(255),
-            length VARCHAR(255),
-            level VARCHAR(255),
-            location VARCHAR(255),
-            method VARCHAR(255),
-            page VARCHAR(255),
-            registration VARCHAR(255),
-            session_id VARCHAR(255),
-            song VARCHAR(255),
-            status VARCHAR(255),
-            ts VARCHAR(255),
-            user_agent VARCHAR(255),
-            user_id VARCHAR(255)
+            artist VARCHAR(255) ENCODE ZSTD,
+            auth VARCHAR(20) ENCODE ZSTD,
+            first_name VARCHAR(100) ENCODE ZSTD,
+            gender CHAR(1) ENCODE ZSTD,
+            item_in_session INTEGER ENCODE AZ64,
+            last_name VARCHAR(100) ENCODE ZSTD,
+            length DOUBLE PRECISION ENCODE ZSTD,
+            level VARCHAR(50) ENCODE ZSTD,
+            location VARCHAR(200) ENCODE ZSTD,
+            method VARCHAR(10) ENCODE ZSTD,
+            page VARCHAR(50) ENCODE ZSTD,
+            registration DOUBLE PRECISION ENCODE ZSTD,
+            session_id BIGINT ENCODE AZ64,
+            song VARCHAR(255) ENCODE ZSTD,
+            status SMALLINT ENCODE AZ64,
+            ts BIGINT ENCODE AZ64,
+            user_agent VARCHAR(255) ENCODE ZSTD,
+            user_id VARCHAR(20) ENCODE ZSTD
         ) BACKUP NO;
         """
     ).format(vault=sql.Identifier(vault))
@@ -109,60 +652,180 @@ def create_table_raw_song_data(vault=DWH_DB_RAW_VAULT, **kwargs):
     return sql.SQL(
         """
         CREATE TABLE IF NOT EXISTS {vault}.raw__song_data (
-            artist_id VARCHAR(255),
-            artist_latitude VARCHAR(255),
-            artist_location VARCHAR(255),
-            artist_longitude VARCHAR(255),
-            artist_name VARCHAR(255),
-            duration VARCHAR(255),
-            num_songs VARCHAR(255),
-            song_id VARCHAR(255),
-            title VARCHAR(255),
-            year VARCHAR(255)
+            artist_id VARCHAR(50) ENCODE ZSTD,
+            artist_latitude DOUBLE PRECISION ENCODE ZSTD,
+            artist_location VARCHAR(255) ENCODE ZSTD,
+            artist_longitude DOUBLE PRECISION ENCODE ZSTD,
+            artist_name VARCHAR(255) ENCODE ZSTD,
+            duration DOUBLE PRECISION ENCODE ZSTD,
+            num_songs SMALLINT ENCODE AZ64,
+            song_id VARCHAR(50) ENCODE ZSTD,
+            title VARCHAR(255) ENCODE ZSTD,
+            year SMALLINT ENCODE AZ64
         ) BACKUP NO;
         """
     ).format(vault=sql.Identifier(vault))
 
 
+def create_table_etl_watermarks(vault=DWH_DB_RAW_VAULT, **kwargs):
+
+    return sql.SQL(
+        """
+        CREATE TABLE IF NOT EXISTS {vault}.etl_watermarks (
+            source VARCHAR(255) NOT NULL PRIMARY KEY ENCODE RAW,
+            watermark VARCHAR(1024) ENCODE ZSTD,
+            max_ts BIGINT ENCODE AZ64,
+            updated_at TIMESTAMP ENCODE AZ64
+        )
+        DISTSTYLE ALL;
+        """
+    ).format(vault=sql.Identifier(vault))
+
+
+def create_table_etl_run_state(vault=DWH_DB_RAW_VAULT, **kwargs):
+
+    return sql.SQL(
+        """
+        CREATE TABLE IF NOT EXISTS {vault}.etl_run_state (
+            run_id VARCHAR(64) NOT NULL ENCODE ZSTD,
+            stage VARCHAR(1024) NOT NULL ENCODE ZSTD,
+            fingerprint VARCHAR(64) ENCODE ZSTD,
+            completed_at TIMESTAMP ENCODE AZ64
+        )
+        DISTSTYLE ALL
+        SORTKEY (completed_at);
+        """
+    ).format(vault=sql.Identifier(vault))
+
+
+# distribution and sort key clauses of a table
+def table_layout(diststyle, distkey=None, sortkey=(), sortstyle='COMPOUND'):
+
+    if diststyle == 'KEY':
+        distribution = sql.SQL('DISTSTYLE KEY DISTKEY ({})').format(
+            sql.Identifier(distkey)
+        )
+    else:
+        distribution = sql.SQL('DISTSTYLE {}').format(sql.SQL(diststyle))
+
+    if sortkey:
+        sorting = sql.SQL('{} SORTKEY ({})').format(
+            sql.SQL(sortstyle),
+            sql.SQL(', ').join(sql.Identifier(x) for x in sortkey),
+        )
+    else:
+        sorting = sql.SQL('')
+
+    return sql.SQL('{distribution}\n        {sorting}').format(
+        distribution=distribution,
+        sorting=sorting,
+    )
+
+
+# change the distribution style of a table in place
+def alter_table_diststyle(schema, table, diststyle, distkey=None):
+
+    if diststyle == 'KEY':
+        distribution = sql.SQL('DISTSTYLE KEY DISTKEY {}').format(
+            sql.Identifier(distkey)
+        )
+    else:
+        distribution = sql.SQL('DISTSTYLE {}').format(sql.SQL(diststyle))
+
+    return sql.SQL(
+        "ALTER TABLE {schema}.{table} ALTER {distribution};"
+    ).format(
+        schema=sql.Identifier(schema),
+        table=sql.Identifier(table),
+        distribution=distribution,
+    )
+
+
+# change the compound sort key of a table in place
+def alter_table_sortkey(schema, table, sortkey):
+
+    return sql.SQL(
+        "ALTER TABLE {schema}.{table} ALTER COMPOUND SORTKEY ({sortkey});"
+    ).format(
+        schema=sql.Identifier(schema),
+        table=sql.Identifier(table),
+        sortkey=sql.SQL(', ').join(sql.Identifier(x) for x in sortkey),
+    )
+
+
 # create public_vault tables
-def create_table_dim_artists(vault=DWH_DB_PUBLIC_VAULT, **kwargs):
+def create_table_dim_artists(
+        vault=DWH_DB_PUBLIC_VAULT,
+        diststyle='KEY',
+        distkey='artist_id',
+        sortkey=('artist_id',),
+        sortstyle='COMPOUND',
+        **kwargs):
 
     return sql.SQL(
         """
         CREATE TABLE IF NOT EXISTS {vault}.dim_artists (
-            artist_id VARCHAR(50) NOT NULL PRIMARY KEY DISTKEY ENCODE RAW,
+            artist_id VARCHAR(50) NOT NULL PRIMARY KEY ENCODE RAW,
             name VARCHAR(200) ENCODE ZSTD,
             location VARCHAR(200) ENCODE ZSTD,
             latitude NUMERIC ENCODE AZ64,
             longitude NUMERIC ENCODE AZ64
         )
-        SORTKEY (artist_id);
+        {layout};
         """
-    ).format(vault=sql.Identifier(vault))
+    ).format(
+        vault=sql.Identifier(vault),
+        layout=table_layout(
+            diststyle=diststyle,
+            distkey=distkey,
+            sortkey=sortkey,
+            sortstyle=sortstyle,
+        ),
+    )
 
 
-def create_table_dim_songs(vault=DWH_DB_PUBLIC_VAULT, **kwargs):
+def create_table_dim_songs(
+        vault=DWH_DB_PUBLIC_VAULT,
+        diststyle='KEY',
+        distkey='song_id',
+        sortkey=('song_id',),
+        sortstyle='COMPOUND',
+        **kwargs):
 
     return sql.SQL(
         """
         CREATE TABLE IF NOT EXISTS {vault}.dim_songs (
-            song_id VARCHAR(50) NOT NULL PRIMARY KEY DISTKEY ENCODE RAW,
+            song_id VARCHAR(50) NOT NULL PRIMARY KEY ENCODE RAW,
             artist_id VARCHAR(50) ENCODE ZSTD,
             title VARCHAR(200) ENCODE ZSTD,
             year SMALLINT ENCODE AZ64,
             duration NUMERIC ENCODE AZ64
         )
-        SORTKEY (song_id);
+        {layout};
         """
-    ).format(vault=sql.Identifier(vault))
+    ).format(
+        vault=sql.Identifier(vault),
+        layout=table_layout(
+            diststyle=diststyle,
+            distkey=distkey,
+            sortkey=sortkey,
+            sortstyle=sortstyle,
+        ),
+    )
 
 
-def create_table_dim_time(vault=DWH_DB_PUBLIC_VAULT, **kwargs):
+def create_table_dim_time(
+        vault=DWH_DB_PUBLIC_VAULT,
+        diststyle='KEY',
+        distkey='time_id',
+        sortkey=('time_id',),
+        sortstyle='COMPOUND',
+        **kwargs):
 
     return sql.SQL(
         """
         CREATE TABLE IF NOT EXISTS {vault}.dim_time (
-            time_id BIGINT NOT NULL PRIMARY KEY DISTKEY ENCODE RAW,
+            time_id BIGINT NOT NULL PRIMARY KEY ENCODE RAW,
             start_time TIMESTAMP ENCODE AZ64,
             hour SMALLINT ENCODE AZ64,
             day SMALLINT ENCODE AZ64,
@@ -171,34 +834,62 @@ def create_table_dim_time(vault=DWH_DB_PUBLIC_VAULT, **kwargs):
             year SMALLINT ENCODE AZ64,
             weekday SMALLINT ENCODE AZ64
         )
-        SORTKEY (time_id);
+        {layout};
         """
-    ).format(vault=sql.Identifier(vault))
+    ).format(
+        vault=sql.Identifier(vault),
+        layout=table_layout(
+            diststyle=diststyle,
+            distkey=distkey,
+            sortkey=sortkey,
+            sortstyle=sortstyle,
+        ),
+    )
 
 
-def create_table_dim_users(vault=DWH_DB_PUBLIC_VAULT, **kwargs):
+def create_table_dim_users(
+        vault=DWH_DB_PUBLIC_VAULT,
+        diststyle='KEY',
+        distkey='user_id',
+        sortkey=('user_id',),
+        sortstyle='COMPOUND',
+        **kwargs):
 
     return sql.SQL(
         """
         CREATE TABLE IF NOT EXISTS {vault}.dim_users (
-            user_id BIGINT NOT NULL PRIMARY KEY DISTKEY ENCODE RAW,
+            user_id BIGINT NOT NULL PRIMARY KEY ENCODE RAW,
             first_name VARCHAR(100) ENCODE ZSTD,
             last_name VARCHAR(100) ENCODE ZSTD,
             gender CHAR(1) ENCODE ZSTD,
             level VARCHAR(50) ENCODE ZSTD
         )
-        SORTKEY (user_id);
+        {layout};
         """
-    ).format(vault=sql.Identifier(vault))
+    ).format(
+        vault=sql.Identifier(vault),
+        layout=table_layout(
+            diststyle=diststyle,
+            distkey=distkey,
+            sortkey=sortkey,
+            sortstyle=sortstyle,
+        ),
+    )
 
 
-def create_table_fact_songplays(vault=DWH_DB_PUBLIC_VAULT, **kwargs):
+def create_table_fact_songplays(
+        vault=DWH_DB_PUBLIC_VAULT,
+        diststyle='KEY',
+        distkey='time_id',
+        sortkey=('time_id',),
+        sortstyle='COMPOUND',
+        **kwargs):
 
     return sql.SQL(
         """
         CREATE TABLE IF NOT EXISTS {vault}.fact_songplays (
             songplay_id BIGINT NOT NULL PRIMARY KEY IDENTITY(0, 1) ENCODE RAW,
-            time_id BIGINT NOT NULL DISTKEY ENCODE AZ64,
+            time_id BIGINT NOT NULL ENCODE AZ64,
             start_time TIMESTAMP ENCODE AZ64,
             user_id BIGINT ENCODE AZ64,
             level VARCHAR(50) ENCODE ZSTD,
@@ -208,9 +899,17 @@ def create_table_fact_songplays(vault=DWH_DB_PUBLIC_VAULT, **kwargs):
             location VARCHAR(200) ENCODE ZSTD,
             user_agent VARCHAR(255) ENCODE ZSTD
         )
-        SORTKEY (time_id);
+        {layout};
         """
-    ).format(vault=sql.Identifier(vault))
+    ).format(
+        vault=sql.Identifier(vault),
+        layout=table_layout(
+            diststyle=diststyle,
+            distkey=distkey,
+            sortkey=sortkey,
+            sortstyle=sortstyle,
+        ),
+    )
 
 
 # transform tables for dimensional model
@@ -227,14 +926,14 @@ def transform_table_dim_artists(
 
         CREATE TEMP TABLE t1 AS
         SELECT
-            artist_id :: VARCHAR,
-            artist_name :: VARCHAR AS name,
-            artist_location :: VARCHAR AS location,
-            artist_latitude :: NUMERIC AS latitude,
-            artist_longitude :: NUMERIC AS longitude,
+            artist_id,
+            artist_name AS name,
+            artist_location AS location,
+            artist_latitude AS latitude,
+            artist_longitude AS longitude,
             ROW_NUMBER() OVER (
                 PARTITION BY artist_id
-                ORDER BY year :: SMALLINT DESC
+                ORDER BY year DESC
             ) AS rn
         FROM {raw_vault}.{raw_table}
         WHERE artist_id IS NOT NULL;
@@ -280,14 +979,11 @@ def transform_table_dim_songs(
 
         CREATE TEMP TABLE t1 AS
         SELECT DISTINCT
-            song_id :: VARCHAR,
-            artist_id :: VARCHAR,
-            title :: VARCHAR,
-            CASE
-                WHEN year = '0' THEN NULL
-                ELSE year :: SMALLINT
-            END AS year,
-            duration :: NUMERIC
+            song_id,
+            artist_id,
+            title,
+            NULLIF(year, 0) AS year,
+            duration
         FROM {raw_vault}.{raw_table}
         WHERE song_id IS NOT NULL;
 
@@ -340,7 +1036,7 @@ def transform_table_dim_time(
             weekday
         )
         SELECT DISTINCT
-            ts :: BIGINT AS time_id,
+            ts AS time_id,
             TIMESTAMP 'epoch' + time_id / 1000 * INTERVAL '1 second'
             AS start_time,
             EXTRACT (HOUR FROM start_time) :: SMALLINT AS hour,
@@ -376,25 +1072,25 @@ def transform_table_dim_users(
 
         CREATE TEMP TABLE t1 AS
         SELECT
-            user_id :: BIGINT,
-            Max(ts) :: BIGINT AS ts
+            user_id::BIGINT AS user_id,
+            Max(ts) AS ts
         FROM {raw_vault}.{raw_table}
         WHERE user_id IS NOT NULL
         GROUP BY user_id;
 
         CREATE TEMP TABLE t2 AS
         SELECT DISTINCT
-            user_id :: BIGINT,
-            first_name :: VARCHAR,
-            last_name :: VARCHAR,
-            gender :: VARCHAR,
-            level :: VARCHAR,
-            ts :: BIGINT
+            user_id::BIGINT AS user_id,
+            first_name,
+            last_name,
+            gender,
+            level,
+            ts
         FROM {raw_vault}.{raw_table} t2
         WHERE t2.user_id IS NOT NULL
             AND t2.ts = (
                 SELECT ts FROM t1
-                WHERE t1.user_id = t2.user_id
+                WHERE t1.user_id = t2.user_id::BIGINT
             );
 
         INSERT INTO {public_vault}.{public_table} (
@@ -440,26 +1136,26 @@ def transform_table_fact_songplays(
 
         CREATE TEMP TABLE t1 AS
         SELECT DISTINCT
-            song_id :: VARCHAR,
-            artist_id :: VARCHAR,
-            artist_name :: VARCHAR,
-            title :: VARCHAR
+            song_id,
+            artist_id,
+            artist_name,
+            title
         FROM {raw_vault}.{raw_song_data} t1
         WHERE song_id IS NOT NULL
         ORDER BY artist_name, title;
 
         CREATE TEMP TABLE t2 AS
         SELECT
-            ts :: BIGINT AS time_id,
+            ts AS time_id,
             TIMESTAMP 'epoch' + time_id / 1000 * INTERVAL '1 second'
             AS start_time,
-            user_id :: BIGINT,
-            level :: VARCHAR,
-            t1.song_id :: VARCHAR AS song_id,
-            t1.artist_id :: VARCHAR AS artist_id,
-            session_id :: BIGINT,
-            location :: VARCHAR,
-            user_agent :: VARCHAR
+            user_id::BIGINT AS user_id,
+            level,
+            t1.song_id AS song_id,
+            t1.artist_id AS artist_id,
+            session_id,
+            location,
+            user_agent
         FROM {raw_vault}.{raw_log_data} t2
         LEFT JOIN t1 ON
             t1.artist_name = t2.artist
@@ -503,3 +1199,125 @@ def transform_table_fact_songplays(
         public_vault=sql.Identifier(public_vault),
         public_table=sql.Identifier(public_table),
     )
+
+
+# merge incremental loads into the dimensional model
+def merge_table_dim_time(
+        raw_table=None,
+        public_table=None,
+        raw_vault=DWH_DB_RAW_VAULT,
+        public_vault=DWH_DB_PUBLIC_VAULT,
+        **kwargs):
+
+    return sql.SQL(
+        """
+        BEGIN;
+
+        CREATE TEMP TABLE t1 AS
+        SELECT DISTINCT
+            ts AS time_id
+        FROM {raw_vault}.{raw_table}
+        WHERE page = 'NextSong'
+            AND ts IS NOT NULL;
+
+        INSERT INTO {public_vault}.{public_table} (
+            time_id,
+            start_time,
+            hour,
+            day,
+            week,
+            month,
+            year,
+            weekday
+        )
+        SELECT
+            t1.time_id,
+            TIMESTAMP 'epoch' + t1.time_id / 1000 * INTERVAL '1 second'
+            AS start_time,
+            EXTRACT (HOUR FROM start_time) :: SMALLINT AS hour,
+            EXTRACT(DAY FROM start_time) :: SMALLINT AS day,
+            EXTRACT(WEEK FROM start_time) :: SMALLINT AS week,
+            EXTRACT(MONTH FROM start_time) :: SMALLINT AS month,
+            EXTRACT(YEAR FROM start_time) :: SMALLINT AS year,
+            EXTRACT(DOW FROM start_time) :: SMALLINT AS weekday
+        FROM t1
+        LEFT JOIN {public_vault}.{public_table} d ON
+            d.time_id = t1.time_id
+        WHERE d.time_id IS NULL;
+
+        DROP TABLE IF EXISTS t1;
+
+        COMMIT;
+        """
+    ).format(
+        raw_vault=sql.Identifier(raw_vault),
+        raw_table=sql.Identifier(raw_table),
+        public_vault=sql.Identifier(public_vault),
+        public_table=sql.Identifier(public_table),
+    )
+
+
+def merge_table_dim_users(
+        raw_table=None,
+        public_table=None,
+        raw_vault=DWH_DB_RAW_VAULT,
+        public_vault=DWH_DB_PUBLIC_VAULT,
+        **kwargs):
+
+    return sql.SQL(
+        """
+        BEGIN;
+
+        CREATE TEMP TABLE t1 AS
+        SELECT
+            user_id::BIGINT AS user_id,
+            Max(ts) AS ts
+        FROM {raw_vault}.{raw_table}
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id;
+
+        CREATE TEMP TABLE t2 AS
+        SELECT DISTINCT
+            user_id::BIGINT AS user_id,
+            first_name,
+            last_name,
+            gender,
+            level,
+            ts
+        FROM {raw_vault}.{raw_table} t2
+        WHERE t2.user_id IS NOT NULL
+            AND t2.ts = (
+                SELECT ts FROM t1
+                WHERE t1.user_id = t2.user_id::BIGINT
+            );
+
+        DELETE FROM {public_vault}.{public_table}
+        USING t2
+        WHERE {public_vault}.{public_table}.user_id = t2.user_id;
+
+        INSERT INTO {public_vault}.{public_table} (
+            user_id,
+            first_name,
+            last_name,
+            gender,
+            level
+        )
+        SELECT
+            user_id,
+            first_name,
+            last_name,
+            gender,
+            level
+        FROM t2;
+
+        DROP TABLE IF EXISTS t1;
+        DROP TABLE IF EXISTS t2;
+
+        COMMIT;
+        """
+    ).format(
+        raw_vault=sql.Identifier(raw_vault),
+        raw_table=sql.Identifier(raw_table),
+        public_vault=sql.Identifier(public_vault),
+        public_table=sql.Identifier(public_table),
+    )
@@ -8,6 +8,41 @@ S3_READ_ACCESS = {
     "arn": "arn:aws:iam::aws:policy/AmazonS3ReadOnlyAccess",
 }
 
+S3_EXPORT_POLICY_NAME = "DwhS3ExportAccess"
+
+
+def s3_export_policy(bucket, prefix):
+    """
+    Return an inline policy which lets the cluster UNLOAD to one S3 prefix,
+    without write access to the rest of the account's buckets.
+
+    Args:
+        bucket (string): Name of the export bucket.
+
+        prefix (string): Key prefix of the exports within the bucket.
+
+    Returns:
+        dict
+    """
+    objects = f"{bucket}/{prefix}/*" if prefix else f"{bucket}/*"
+
+    return {
+      "Version": "2012-10-17",
+      "Statement": [
+        {
+          "Effect": "Allow",
+          "Action": ["s3:PutObject", "s3:DeleteObject"],
+          "Resource": f"arn:aws:s3:::{objects}"
+        },
+        {
+          "Effect": "Allow",
+          "Action": "s3:ListBucket",
+          "Resource": f"arn:aws:s3:::{bucket}"
+        }
+      ]
+    }
+
+
 REDSHIFT_TRUST_RELATIONSHIP = {
   "Version": "2012-10-17",
   "Statement": [
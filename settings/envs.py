@@ -1,4 +1,5 @@
 import configparser as configparser
+import os
 
 
 # read config file
@@ -10,6 +11,7 @@ AWS_KEY = config.get('IAM', 'AWS_KEY')
 AWS_REGION = config.get('IAM', 'AWS_REGION')
 AWS_SECRET = config.get('IAM', 'AWS_SECRET')
 AWS_DB_ROLE = config.get('IAM', 'AWS_DB_ROLE')
+AWS_ROLE_MODE = config.get('IAM', 'AWS_ROLE_MODE', fallback='recreate')
 
 # redshift credentials
 DWH_DB_USER = config.get('REDSHIFT', 'DWH_DB_USER')
@@ -22,6 +24,27 @@ DWH_CLUSTER_IDENTIFIER = config.get('REDSHIFT', 'DWH_CLUSTER_IDENTIFIER')
 DWH_NODE_TYPE = config.get('REDSHIFT', 'DWH_NODE_TYPE')
 DWH_NUM_NODES = config.get('REDSHIFT', 'DWH_NUM_NODES')
 
+DWH_CLUSTER_CACHE_TTL = config.getfloat(
+    'REDSHIFT', 'DWH_CLUSTER_CACHE_TTL', fallback=30
+)
+DWH_CLUSTER_WAIT_TIMEOUT = config.getfloat(
+    'REDSHIFT', 'DWH_CLUSTER_WAIT_TIMEOUT', fallback=1800
+)
+DWH_PROVISIONING = config.get(
+    'REDSHIFT', 'DWH_PROVISIONING', fallback='create'
+)
+
+# redshift session parameters
+DWH_QUERY_GROUP = config.get('REDSHIFT', 'DWH_QUERY_GROUP', fallback='')
+DWH_STATEMENT_TIMEOUT = config.getint(
+    'REDSHIFT', 'DWH_STATEMENT_TIMEOUT', fallback=0
+)
+DWH_SEARCH_PATH = [
+    x.strip() for x in
+    config.get('REDSHIFT', 'DWH_SEARCH_PATH', fallback='').split(',')
+    if x.strip()
+]
+
 # data warehouse vaults
 DWH_DB_PUBLIC_VAULT = config.get('REDSHIFT', 'DWH_DB_PUBLIC_VAULT')
 DWH_DB_RAW_VAULT = config.get('REDSHIFT', 'DWH_DB_RAW_VAULT')
@@ -30,3 +53,114 @@ DWH_DB_RAW_VAULT = config.get('REDSHIFT', 'DWH_DB_RAW_VAULT')
 S3_LOG_DATAPATH = config.get('S3', 'S3_LOG_DATAPATH')
 S3_LOG_JSONPATH = config.get('S3', 'S3_LOG_JSONPATH')
 S3_SONG_DATAPATH = config.get('S3', 'S3_SONG_DATAPATH')
+S3_EXPORT_DATAPATH = config.get(
+    'S3', 'S3_EXPORT_DATAPATH', fallback=''
+).rstrip('/')
+S3_STAGING_DATAPATH = config.get(
+    'S3', 'S3_STAGING_DATAPATH', fallback=''
+).rstrip('/')
+S3_ENDPOINT_URL = config.get('S3', 'S3_ENDPOINT_URL', fallback='') or None
+S3_MANIFEST_DATAPATH = config.get(
+    'S3', 'S3_MANIFEST_DATAPATH', fallback=''
+).rstrip('/') or (
+    f'{S3_STAGING_DATAPATH}/manifests' if S3_STAGING_DATAPATH else ''
+)
+
+# etl scheduling
+DWH_MAX_CONCURRENCY = config.getint(
+    'ETL', 'DWH_MAX_CONCURRENCY', fallback=4
+)
+DWH_COPY_PARALLELISM = config.getint(
+    'ETL', 'DWH_COPY_PARALLELISM', fallback=2
+)
+DWH_COPY_MAXERROR = config.getint(
+    'ETL', 'DWH_COPY_MAXERROR', fallback=0
+)
+DWH_LOAD_PROFILE = config.get('ETL', 'DWH_LOAD_PROFILE', fallback='full')
+DWH_RUN_STATE_PATH = config.get(
+    'ETL', 'DWH_RUN_STATE_PATH', fallback='.etl/run_state.json'
+)
+
+# s3 pre-staging
+DWH_STAGING_WORKERS = config.getint(
+    'ETL', 'DWH_STAGING_WORKERS', fallback=4
+)
+DWH_STAGING_OBJECT_MB = config.getint(
+    'ETL', 'DWH_STAGING_OBJECT_MB', fallback=64
+)
+DWH_STAGING_FORMAT = config.get(
+    'ETL', 'DWH_STAGING_FORMAT', fallback='json'
+)
+
+DWH_COMPRESSION_DDL_PATH = config.get(
+    'ETL', 'DWH_COMPRESSION_DDL_PATH', fallback='.etl/compression.sql'
+)
+
+# query plan capture
+DWH_PLAN_CAPTURE = config.get('ETL', 'DWH_PLAN_CAPTURE', fallback='warn')
+DWH_PLAN_BASELINE_PATH = config.get(
+    'ETL', 'DWH_PLAN_BASELINE_PATH', fallback='.etl/plan_baseline.json'
+)
+DWH_PLAN_REGRESSION_PCT = config.getfloat(
+    'ETL', 'DWH_PLAN_REGRESSION_PCT', fallback=50
+)
+
+# query statistics
+DWH_QUERY_STATS = config.getboolean(
+    'ETL', 'DWH_QUERY_STATS', fallback=True
+)
+
+# logging, the environment takes precedence over the config file
+DWH_LOG_LEVEL = os.environ.get(
+    'DWH_LOG_LEVEL', config.get('LOGGING', 'DWH_LOG_LEVEL', fallback='INFO')
+)
+DWH_LOG_FORMAT = os.environ.get(
+    'DWH_LOG_FORMAT', config.get('LOGGING', 'DWH_LOG_FORMAT', fallback='text')
+)
+
+# metrics exports
+DWH_METRICS_PROM_PATH = config.get(
+    'ETL', 'DWH_METRICS_PROM_PATH', fallback='.etl/metrics.prom'
+)
+DWH_METRICS_JSONL_PATH = config.get(
+    'ETL', 'DWH_METRICS_JSONL_PATH', fallback='.etl/metrics.jsonl'
+)
+
+# distribution and sort key planner
+DWH_DIST_ALL_MAX_ROWS = config.getint(
+    'ETL', 'DWH_DIST_ALL_MAX_ROWS', fallback=1000000
+)
+DWH_INTERLEAVED_MIN_ROWS = config.getint(
+    'ETL', 'DWH_INTERLEAVED_MIN_ROWS', fallback=10000000
+)
+DWH_TABLE_LAYOUT_PATH = config.get(
+    'ETL', 'DWH_TABLE_LAYOUT_PATH', fallback='.etl/table_layouts.json'
+)
+
+# table maintenance thresholds, in percent
+DWH_MAINTENANCE_UNSORTED_PCT = config.getfloat(
+    'ETL', 'DWH_MAINTENANCE_UNSORTED_PCT', fallback=10
+)
+DWH_MAINTENANCE_DEEP_COPY_PCT = config.getfloat(
+    'ETL', 'DWH_MAINTENANCE_DEEP_COPY_PCT', fallback=50
+)
+DWH_MAINTENANCE_DELETED_PCT = config.getfloat(
+    'ETL', 'DWH_MAINTENANCE_DELETED_PCT', fallback=10
+)
+DWH_MAINTENANCE_STATS_OFF_PCT = config.getfloat(
+    'ETL', 'DWH_MAINTENANCE_STATS_OFF_PCT', fallback=10
+)
+
+# connection pool
+DWH_POOL_MIN = config.getint('ETL', 'DWH_POOL_MIN', fallback=1)
+DWH_POOL_MAX = config.getint(
+    'ETL',
+    'DWH_POOL_MAX',
+    fallback=max(DWH_MAX_CONCURRENCY, DWH_COPY_PARALLELISM) + 1,
+)
+DWH_POOL_HEALTHCHECK_IDLE = config.getfloat(
+    'ETL', 'DWH_POOL_HEALTHCHECK_IDLE', fallback=30
+)
+DWH_STREAM_ITERSIZE = config.getint(
+    'ETL', 'DWH_STREAM_ITERSIZE', fallback=10000
+)